@@ -0,0 +1,68 @@
+"""
+Allocation-free aggregation of sensor samples.
+
+The functions work on the first `count` items of a preallocated
+array('H'), array('f') or list and reorder them in place, so sampling
+loops can keep a fixed buffer for the lifetime of a driver.
+"""
+
+
+def sort_samples(values, count):
+    """Sorts the first count items of values in place (insertion sort, the
+    buffers hold a few dozen samples at most)."""
+    for index in range(1, count):
+        value = values[index]
+        position = index - 1
+        while position >= 0 and values[position] > value:
+            values[position + 1] = values[position]
+            position -= 1
+        values[position + 1] = value
+
+
+def median(values, count):
+    """Returns the median of the first count items of values.
+
+    The items are sorted in place. Returns None when count is 0.
+    """
+    if count < 1:
+        return None
+    sort_samples(values, count)
+    middle = count // 2
+    if count % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def median_absolute_deviation(values, count, center, scratch):
+    """Returns the median absolute deviation of the first count items of
+    values around center, using scratch (same length) as work space."""
+    for index in range(count):
+        scratch[index] = abs(values[index] - center)
+    return median(scratch, count)
+
+
+def robust_median(values, count, scratch, threshold=3.0):
+    """Median with MAD based outlier rejection.
+
+    Samples further than threshold median absolute deviations from the
+    median are dropped and the median of the remaining samples is
+    returned. values is reordered in place, scratch has to be at least
+    count items long.
+
+    Returns:
+        tuple: (median, number of samples kept, median absolute deviation),
+        (None, 0, 0) when count is 0.
+    """
+    if count < 1:
+        return None, 0, 0
+    center = median(values, count)
+    spread = median_absolute_deviation(values, count, center, scratch)
+    if not spread:
+        return center, count, spread
+
+    kept = 0
+    for index in range(count):
+        if abs(values[index] - center) <= threshold * spread:
+            values[kept] = values[index]
+            kept += 1
+    return median(values, kept), kept, spread
@@ -46,28 +46,79 @@ BME280_OSAMPLE_4 = 3
 BME280_OSAMPLE_8 = 4
 BME280_OSAMPLE_16 = 5
 
+# IIR filter coefficients
+BME280_FILTER_OFF = 0
+BME280_FILTER_2 = 1
+BME280_FILTER_4 = 2
+BME280_FILTER_8 = 3
+BME280_FILTER_16 = 4
+
 BME280_REGISTER_CONTROL_HUM = 0xF2
+BME280_REGISTER_STATUS = 0xF3
 BME280_REGISTER_CONTROL = 0xF4
+BME280_REGISTER_CONFIG = 0xF5
+
+BME280_STATUS_MEASURING = 0x08
+BME280_STATUS_POLL_US = 500
+
+
+def measurement_time_us(osrs_t, osrs_p, osrs_h):
+    """ Maximum duration of a forced measurement, from the datasheet:
+        1.25 + 2.3 * T + (2.3 * P + 0.575) + (2.3 * H + 0.575) ms
+        with T, P and H the oversampling ratio of each channel.
+    """
+    return (
+        1250
+        + 2300 * (1 << (osrs_t - 1))
+        + 2300 * (1 << (osrs_p - 1)) + 575
+        + 2300 * (1 << (osrs_h - 1)) + 575
+    )
 
 
 class BME280:
     def __init__(
-        self, mode=BME280_OSAMPLE_1, address=BME280_I2CADDR, i2c=None, **kwargs
+        self,
+        mode=BME280_OSAMPLE_1,
+        address=BME280_I2CADDR,
+        i2c=None,
+        osrs_t=None,
+        osrs_p=None,
+        osrs_h=None,
+        iir=BME280_FILTER_OFF,
+        poll_status=False,
+        **kwargs
     ):
-        # Check that mode is valid.
-        if mode not in [
-            BME280_OSAMPLE_1,
-            BME280_OSAMPLE_2,
-            BME280_OSAMPLE_4,
-            BME280_OSAMPLE_8,
-            BME280_OSAMPLE_16,
-        ]:
-            raise ValueError(
-                "Unexpected mode value {0}. Set mode to one of "
-                "BME280_ULTRALOWPOWER, BME280_STANDARD, BME280_HIGHRES, or "
-                "BME280_ULTRAHIGHRES".format(mode)
-            )
+        """ mode is the oversampling of every channel unless overridden
+            per channel by osrs_t, osrs_p and osrs_h. iir is one of the
+            BME280_FILTER_* coefficients. With poll_status the status
+            register is polled instead of waiting the maximum measurement
+            time.
+        """
+        osrs_t = mode if osrs_t is None else osrs_t
+        osrs_p = mode if osrs_p is None else osrs_p
+        osrs_h = mode if osrs_h is None else osrs_h
+        # Check that the oversampling values are valid.
+        for oversampling in (osrs_t, osrs_p, osrs_h):
+            if oversampling not in [
+                BME280_OSAMPLE_1,
+                BME280_OSAMPLE_2,
+                BME280_OSAMPLE_4,
+                BME280_OSAMPLE_8,
+                BME280_OSAMPLE_16,
+            ]:
+                raise ValueError(
+                    "Unexpected oversampling value {0}. Set it to one of "
+                    "BME280_OSAMPLE_1, BME280_OSAMPLE_2, BME280_OSAMPLE_4, "
+                    "BME280_OSAMPLE_8 or BME280_OSAMPLE_16".format(oversampling)
+                )
+        if iir not in range(BME280_FILTER_OFF, BME280_FILTER_16 + 1):
+            raise ValueError("Unexpected IIR filter value {0}".format(iir))
         self._mode = mode
+        # register values and wait time of a forced measurement
+        self._ctrl_hum = osrs_h
+        self._ctrl_meas = osrs_t << 5 | osrs_p << 2 | 1
+        self._measurement_time_us = measurement_time_us(osrs_t, osrs_p, osrs_h)
+        self._poll_status = poll_status
         self.address = address
         if i2c is None:
             raise ValueError("An I2C object is required.")
@@ -102,6 +153,10 @@ class BME280:
 
         self.dig_H6 = unpack_from("<b", dig_e1_e7, 6)[0]
 
+        # the config register is only written reliably in sleep mode
+        self.i2c.writeto_mem(
+            self.address, BME280_REGISTER_CONFIG, bytearray([iir << 2])
+        )
         self.i2c.writeto_mem(
             self.address, BME280_REGISTER_CONTROL, bytearray([0x3F])
         )
@@ -111,6 +166,7 @@ class BME280:
         self._l1_barray = bytearray(1)
         self._l8_barray = bytearray(8)
         self._l3_resultarray = array("i", [0, 0, 0])
+        self._l3_fixedarray = array("i", [0, 0, 0])
 
     def read_raw_data(self, result):
         """ Reads the raw (uncompensated) data from the sensor.
@@ -122,19 +178,19 @@ class BME280:
                 None
         """
 
-        self._l1_barray[0] = self._mode
+        self._l1_barray[0] = self._ctrl_hum
         self.i2c.writeto_mem(
             self.address, BME280_REGISTER_CONTROL_HUM, self._l1_barray
         )
-        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 1
+        self._l1_barray[0] = self._ctrl_meas
         self.i2c.writeto_mem(
             self.address, BME280_REGISTER_CONTROL, self._l1_barray
         )
 
-        sleep_time = 1250 + 2300 * (1 << self._mode)
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        time.sleep_us(sleep_time)  # Wait the required time
+        if self._poll_status:
+            self._wait_measurement()
+        else:
+            time.sleep_us(self._measurement_time_us)  # Wait the required time
 
         # burst readout from 0xF7 to 0xFE, recommended by datasheet
         self.i2c.readfrom_mem_into(self.address, 0xF7, self._l8_barray)
@@ -150,6 +206,21 @@ class BME280:
         result[1] = raw_press
         result[2] = raw_hum
 
+    def _wait_measurement(self):
+        """ Polls the status register until the measurement is done, at
+            most for the maximum measurement time.
+        """
+        deadline = time.ticks_add(time.ticks_us(), self._measurement_time_us)
+        while True:
+            time.sleep_us(BME280_STATUS_POLL_US)
+            self.i2c.readfrom_mem_into(
+                self.address, BME280_REGISTER_STATUS, self._l1_barray
+            )
+            if not self._l1_barray[0] & BME280_STATUS_MEASURING:
+                return
+            if time.ticks_diff(deadline, time.ticks_us()) <= 0:
+                return
+
     def read_compensated_data(self, result=None):
         """ Reads the data from the sensor and returns the compensated data.
 
@@ -234,27 +305,36 @@ class BME280:
 
         return array("i", (temp, pressure, humidity))
 
-    @property
-    def values(self):
-        """ human readable values """
+    def read_fixed_point(self, result=None):
+        """ Reads the data from the sensor as integers.
 
-        t, p, h = self.read_compensated_data()
+            Args:
+                result: array of length 3 or alike where the result will be
+                stored. You may use this to read out the sensor without
+                allocating heap memory
 
-        p = p // 256
-        pi = p // 100
-        pd = p - pi * 100
+            Returns:
+                array with temperature in 0.01 C, pressure in Pa and
+                humidity in 0.01 %RH. Will be the one from the result
+                parameter if not None
+        """
+        if result is None:
+            result = array("i", (0, 0, 0))
+        self.read_compensated_data(result)
+        result[1] = result[1] >> 8
+        result[2] = (result[2] * 100) >> 10
+        return result
 
-        hi = h // 1024
-        hd = h * 100 // 1024 - hi * 100
+    @property
+    def values(self):
+        """ human readable values """
 
-        temperature = float(t / 100)
-        pressure = float("{}.{:02d}".format(pi, pd))
-        humidity = float("{}.{:02d}".format(hi, hd))
+        t, p, h = self.read_fixed_point(self._l3_fixedarray)
         return {
-            "temperature": temperature,
+            "temperature": t / 100,
             "temperature_unit": "C",
-            "pressure": pressure,
+            "pressure": p / 100,
             "pressure_unit": "hPa",
-            "humidity": humidity,
+            "humidity": h / 100,
             "humidity_unit": "%",
         }
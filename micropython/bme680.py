@@ -13,11 +13,22 @@ class BME680(BME680Data):
     :param i2c_addr: One of I2C_ADDR_PRIMARY (0x76) or I2C_ADDR_SECONDARY (0x77)
     :param i2c_device: Optional smbus or compatible instance for facilitating i2c communications.
 
+    The configuration registers 0x70 to 0x75 are cached: the setters only update the cache and
+    the changed registers are written in one burst, together with the power mode, by set_power_mode.
+
     """
 
     def __init__(self, i2c_addr=I2C_ADDR_PRIMARY, i2c_device=None):
         BME680Data.__init__(self)
 
+        # shadow copy of the configuration registers, see _commit_config
+        self._config = bytearray(CONF_SHADOW_LEN)
+        self._config_dirty = 0
+        self._config_burst = bytearray(2 * CONF_SHADOW_LEN)
+        self.gas_settings.heater_duration = 0
+        self._heater_durations = [0] * (NBCONV_MAX + 1)
+        self._field = bytearray(FIELD_LENGTH)
+
         self.i2c_addr = i2c_addr
         self._i2c = i2c_device
         if self._i2c is None:
@@ -59,11 +70,86 @@ class BME680(BME680Data):
 
         self.calibration_data.set_from_array(calibration)
         self.calibration_data.set_other(heat_range, heat_value, sw_error)
+        self._fold_calibration()
+
+    def _fold_calibration(self):
+        """Precomputes the calibration terms used by the compensation formulas
+
+        The shifted and multiplied coefficients never change after calibration, they are kept
+        in tuples unpacked into locals by each _calc_* method. The gas resistance terms only
+        depend on the gas range and are tabulated for all 16 ranges.
+
+        """
+        c = self.calibration_data
+        self._temperature_coeffs = (c.par_t1 << 1, c.par_t2, c.par_t3 << 4)
+        self._pressure_coeffs = (
+            c.par_p1,
+            c.par_p2,
+            c.par_p3 << 5,
+            c.par_p4 << 16,
+            c.par_p5 << 1,
+            c.par_p6,
+            c.par_p7 << 7,
+            c.par_p8,
+            c.par_p9,
+            c.par_p10,
+        )
+        self._humidity_coeffs = (
+            c.par_h1 * 16,
+            c.par_h2,
+            c.par_h3,
+            c.par_h4,
+            c.par_h5,
+            c.par_h6 << 7,
+            c.par_h7,
+        )
+        sw_err_term = 1340 + (5 * c.range_sw_err)
+        self._gas_var1 = tuple(
+            (sw_err_term * lookupTable1[gas_range]) >> 16 for gas_range in range(16)
+        )
+        self._gas_var3 = tuple(
+            (lookupTable2[gas_range] * self._gas_var1[gas_range]) >> 9
+            for gas_range in range(16)
+        )
 
     def soft_reset(self):
         """Initiate a soft reset"""
         self._set_regs(SOFT_RESET_ADDR, SOFT_RESET_CMD)
         time.sleep(RESET_PERIOD / 1000.0)
+        self._read_config()
+
+    def _read_config(self):
+        """Loads the shadow copy of the configuration registers from the sensor"""
+        self._config[:] = self._get_regs(CONF_SHADOW_ADDR, CONF_SHADOW_LEN)
+        self._config_dirty = 0
+
+    def _commit_config(self, mode=False):
+        """Writes the changed configuration registers in a single burst
+
+        The BME680 takes register/value pairs in one I2C write, ctrl_meas goes last so
+        the settings are in place when the power mode changes.
+
+        :param mode: Also write ctrl_meas, even if it did not change
+
+        """
+        dirty = self._config_dirty
+        if mode:
+            dirty |= 1 << (CONF_T_P_MODE_ADDR - CONF_SHADOW_ADDR)
+        if not dirty:
+            return
+
+        burst = self._config_burst
+        length = 0
+        for register in CONF_SHADOW_WRITE_ORDER:
+            index = register - CONF_SHADOW_ADDR
+            if dirty & (1 << index):
+                burst[length] = register
+                burst[length + 1] = self._config[index]
+                length += 2
+        self._i2c.write_i2c_block_data(
+            self.i2c_addr, burst[0], memoryview(burst)[1:length]
+        )
+        self._config_dirty = 0
 
     def set_humidity_oversample(self, value):
         """Set humidity oversampling
@@ -82,7 +168,7 @@ class BME680(BME680Data):
 
     def get_humidity_oversample(self):
         """Get humidity oversampling"""
-        return (self._get_regs(CONF_OS_H_ADDR, 1) & OSH_MSK) >> OSH_POS
+        return (self._get_config(CONF_OS_H_ADDR) & OSH_MSK) >> OSH_POS
 
     def set_pressure_oversample(self, value):
         """Set temperature oversampling
@@ -101,7 +187,7 @@ class BME680(BME680Data):
 
     def get_pressure_oversample(self):
         """Get pressure oversampling"""
-        return (self._get_regs(CONF_T_P_MODE_ADDR, 1) & OSP_MSK) >> OSP_POS
+        return (self._get_config(CONF_T_P_MODE_ADDR) & OSP_MSK) >> OSP_POS
 
     def set_temperature_oversample(self, value):
         """Set pressure oversampling
@@ -120,7 +206,7 @@ class BME680(BME680Data):
 
     def get_temperature_oversample(self):
         """Get temperature oversampling"""
-        return (self._get_regs(CONF_T_P_MODE_ADDR, 1) & OST_MSK) >> OST_POS
+        return (self._get_config(CONF_T_P_MODE_ADDR) & OST_MSK) >> OST_POS
 
     def set_filter(self, value):
         """Set IIR filter size
@@ -141,7 +227,7 @@ class BME680(BME680Data):
     def get_filter(self):
         """Get filter size"""
         return (
-                self._get_regs(CONF_ODR_FILT_ADDR, 1) & FILTER_MSK
+                self._get_config(CONF_ODR_FILT_ADDR) & FILTER_MSK
         ) >> FILTER_POS
 
     def select_gas_heater_profile(self, value):
@@ -162,7 +248,7 @@ class BME680(BME680Data):
 
     def get_gas_heater_profile(self):
         """Get gas sensor conversion profile: 0 to 9"""
-        return self._get_regs(CONF_ODR_RUN_GAS_NBC_ADDR, 1) & NBCONV_MSK
+        return self._get_config(CONF_ODR_RUN_GAS_NBC_ADDR) & NBCONV_MSK
 
     def set_gas_status(self, value):
         """Enable/disable gas sensor"""
@@ -174,7 +260,7 @@ class BME680(BME680Data):
     def get_gas_status(self):
         """Get the current gas status"""
         return (
-                self._get_regs(CONF_ODR_RUN_GAS_NBC_ADDR, 1) & RUN_GAS_MSK
+                self._get_config(CONF_ODR_RUN_GAS_NBC_ADDR) & RUN_GAS_MSK
         ) >> RUN_GAS_POS
 
     def set_gas_heater_profile(self, temperature, duration, nb_profile=0):
@@ -231,6 +317,7 @@ class BME680(BME680Data):
             )
 
         self.gas_settings.heater_duration = value
+        self._heater_durations[nb_profile] = value
         temp = self._calc_heater_duration(self.gas_settings.heater_duration)
         self._set_regs(GAS_WAIT0_ADDR + nb_profile, temp)
 
@@ -242,6 +329,8 @@ class BME680(BME680Data):
         self.power_mode = value
 
         self._set_bits(CONF_T_P_MODE_ADDR, MODE_MSK, MODE_POS, value)
+        # the sensor falls back to sleep after a forced measurement, always write the mode
+        self._commit_config(mode=True)
 
         while blocking and self.get_power_mode() != self.power_mode:
             time.sleep(POLL_PERIOD_MS / 1000.0)
@@ -251,59 +340,132 @@ class BME680(BME680Data):
         self.power_mode = self._get_regs(CONF_T_P_MODE_ADDR, 1)
         return self.power_mode
 
+    def get_profile_duration(self):
+        """Get the duration of a forced measurement in milliseconds
+
+        Computed from the oversampling settings and the heater duration like
+        calc_profile_dur in the Bosch BME68x API.
+
+        """
+        meas_cycles = (
+            OS_MEAS_CYCLES[self.get_temperature_oversample()]
+            + OS_MEAS_CYCLES[self.get_pressure_oversample()]
+            + OS_MEAS_CYCLES[self.get_humidity_oversample()]
+        )
+        duration = meas_cycles * MEAS_CYCLE_DURATION_US
+        duration += TPH_SWITCHING_DURATION_US + GAS_MEAS_DURATION_US
+        duration = (duration + 500) // 1000 + WAKE_UP_DURATION_MS
+        if self.get_gas_status():
+            duration += self._heater_durations[self.get_gas_heater_profile()]
+        return duration
+
+    def trigger(self):
+        """Start a forced measurement without waiting for it
+
+        Returns the milliseconds until the data can be read with collect().
+
+        """
+        self.set_power_mode(FORCED_MODE, blocking=False)
+        return self.get_profile_duration()
+
+    def collect(self):
+        """Read the measurement started by trigger()
+
+        Stores data in .data and returns True if new data was available.
+
+        """
+        if (self._get_regs(FIELD0_ADDR, 1) & NEW_DATA_MSK) == 0:
+            return False
+
+        regs = self._field
+        if hasattr(self._i2c, "read_into"):
+            self._i2c.read_into(self.i2c_addr, FIELD0_ADDR, regs)
+        else:
+            regs[:] = self._get_regs(FIELD0_ADDR, FIELD_LENGTH)
+
+        self.data.status = regs[0] & NEW_DATA_MSK
+        # Contains the nb_profile used to obtain the current measurement
+        self.data.gas_index = regs[0] & GAS_INDEX_MSK
+        self.data.meas_index = regs[1]
+
+        adc_pres = (regs[2] << 12) | (regs[3] << 4) | (regs[4] >> 4)
+        adc_temp = (regs[5] << 12) | (regs[6] << 4) | (regs[7] >> 4)
+        adc_hum = (regs[8] << 8) | regs[9]
+        adc_gas_res = (regs[13] << 2) | (regs[14] >> 6)
+        gas_range = regs[14] & GAS_RANGE_MSK
+
+        self.data.status |= regs[14] & GASM_VALID_MSK
+        self.data.status |= regs[14] & HEAT_STAB_MSK
+
+        self.data.heat_stable = (self.data.status & HEAT_STAB_MSK) > 0
+
+        temperature = self._calc_temperature(adc_temp)
+        self.data.temperature = temperature / 100.0
+        self.ambient_temperature = temperature // 100  # Saved for heater calc, in degrees Celsius
+
+        self.data.pressure = self._calc_pressure(adc_pres) / 100.0
+        self.data.humidity = self._calc_humidity(adc_hum) / 1000.0
+        self.data.gas_resistance = self._calc_gas_resistance(
+            adc_gas_res, gas_range
+        )
+        return True
+
     def get_sensor_data(self):
         """Get sensor data.
 
-        Stores data in .data and returns True upon success.
+        Sleeps for the measurement duration, stores data in .data and returns True upon success.
 
         """
-        self.set_power_mode(FORCED_MODE)
+        time.sleep_ms(self.trigger())
 
-        for _ in range(10):
-            status = self._get_regs(FIELD0_ADDR, 1)
+        for _ in range(COLLECT_RETRIES):
+            if self.collect():
+                return True
+            time.sleep_ms(POLL_PERIOD_MS)
 
-            if (status & NEW_DATA_MSK) == 0:
-                time.sleep(POLL_PERIOD_MS / 1000.0)
-                continue
+        return self.collect()
 
-            regs = self._get_regs(FIELD0_ADDR, FIELD_LENGTH)
+    async def get_sensor_data_async(self):
+        """Get sensor data, yielding to other uasyncio tasks during the measurement.
 
-            self.data.status = regs[0] & NEW_DATA_MSK
-            # Contains the nb_profile used to obtain the current measurement
-            self.data.gas_index = regs[0] & GAS_INDEX_MSK
-            self.data.meas_index = regs[1]
+        Stores data in .data and returns True upon success.
 
-            adc_pres = (regs[2] << 12) | (regs[3] << 4) | (regs[4] >> 4)
-            adc_temp = (regs[5] << 12) | (regs[6] << 4) | (regs[7] >> 4)
-            adc_hum = (regs[8] << 8) | regs[9]
-            adc_gas_res = (regs[13] << 2) | (regs[14] >> 6)
-            gas_range = regs[14] & GAS_RANGE_MSK
+        """
+        import uasyncio
 
-            self.data.status |= regs[14] & GASM_VALID_MSK
-            self.data.status |= regs[14] & HEAT_STAB_MSK
+        await uasyncio.sleep_ms(self.trigger())
 
-            self.data.heat_stable = (self.data.status & HEAT_STAB_MSK) > 0
+        for _ in range(COLLECT_RETRIES):
+            if self.collect():
+                return True
+            await uasyncio.sleep_ms(POLL_PERIOD_MS)
 
-            temperature = self._calc_temperature(adc_temp)
-            self.data.temperature = temperature / 100.0
-            self.ambient_temperature = temperature  # Saved for heater calc
+        return self.collect()
 
-            self.data.pressure = self._calc_pressure(adc_pres) / 100.0
-            self.data.humidity = self._calc_humidity(adc_hum) / 1000.0
-            self.data.gas_resistance = self._calc_gas_resistance(
-                adc_gas_res, gas_range
-            )
-            return True
+    def _set_bits(self, register, mask, position, value):
+        """Mask out and set one or more bits in a register
 
-        return False
+        Cached configuration registers are only updated in the shadow copy and written
+        by _commit_config.
+
+        """
+        index = register - CONF_SHADOW_ADDR
+        if 0 <= index < CONF_SHADOW_LEN:
+            temp = (self._config[index] & ~mask) | (value << position)
+            if temp != self._config[index]:
+                self._config[index] = temp
+                self._config_dirty |= 1 << index
+            return
 
-    def _set_bits(self, register, mask, position, value):
-        """Mask out and set one or more bits in a register"""
         temp = self._get_regs(register, 1)
         temp &= ~mask
         temp |= value << position
         self._set_regs(register, temp)
 
+    def _get_config(self, register):
+        """Get a cached configuration register"""
+        return self._config[register - CONF_SHADOW_ADDR]
+
     def _set_regs(self, register, value):
         """Set one or more registers"""
         if isinstance(value, int):
@@ -321,34 +483,28 @@ class BME680(BME680Data):
             )
 
     def _calc_temperature(self, temperature_adc):
-        # sourcery skip: inline-immediately-returned-variable
-        var1 = (temperature_adc >> 3) - (self.calibration_data.par_t1 << 1)
-        var2 = (var1 * self.calibration_data.par_t2) >> 11
+        t1_x2, t2, t3_x16 = self._temperature_coeffs
+        var1 = (temperature_adc >> 3) - t1_x2
+        var2 = (var1 * t2) >> 11
         var3 = ((var1 >> 1) * (var1 >> 1)) >> 12
-        var3 = (var3 * (self.calibration_data.par_t3 << 4)) >> 14
+        var3 = (var3 * t3_x16) >> 14
 
         # Save temperature data for pressure calculations
-        self.calibration_data.t_fine = var2 + var3
-        calc_temp = ((self.calibration_data.t_fine * 5) + 128) >> 8
-
-        return calc_temp
+        t_fine = var2 + var3
+        self.calibration_data.t_fine = t_fine
+        return ((t_fine * 5) + 128) >> 8
 
     def _calc_pressure(self, pressure_adc):
-        # sourcery skip: inline-immediately-returned-variable
+        p1, p2, p3_x32, p4_x65536, p5_x2, p6, p7_x128, p8, p9, p10 = self._pressure_coeffs
         var1 = (self.calibration_data.t_fine >> 1) - 64000
-        var2 = (
-                       (((var1 >> 2) * (var1 >> 2)) >> 11) * self.calibration_data.par_p6
-               ) >> 2
-        var2 = var2 + ((var1 * self.calibration_data.par_p5) << 1)
-        var2 = (var2 >> 2) + (self.calibration_data.par_p4 << 16)
-        var1 = (
-                       (((var1 >> 2) * (var1 >> 2)) >> 13)
-                       * (self.calibration_data.par_p3 << 5)
-                       >> 3
-               ) + ((self.calibration_data.par_p2 * var1) >> 1)
+        var1_sq = (var1 >> 2) * (var1 >> 2)
+        var2 = ((var1_sq >> 11) * p6) >> 2
+        var2 = var2 + (var1 * p5_x2)
+        var2 = (var2 >> 2) + p4_x65536
+        var1 = (((var1_sq >> 13) * p3_x32) >> 3) + ((p2 * var1) >> 1)
         var1 = var1 >> 18
 
-        var1 = ((32768 + var1) * self.calibration_data.par_p1) >> 15
+        var1 = ((32768 + var1) * p1) >> 15
         calc_pressure = 1048576 - pressure_adc
         calc_pressure = (calc_pressure - (var2 >> 12)) * 3125
 
@@ -357,54 +513,27 @@ class BME680(BME680Data):
         else:
             calc_pressure = (calc_pressure << 1) // var1
 
-        var1 = (
-                       self.calibration_data.par_p9
-                       * (((calc_pressure >> 3) * (calc_pressure >> 3)) >> 13)
-               ) >> 12
-        var2 = ((calc_pressure >> 2) * self.calibration_data.par_p8) >> 13
-        var3 = (
-                       (calc_pressure >> 8)
-                       * (calc_pressure >> 8)
-                       * (calc_pressure >> 8)
-                       * self.calibration_data.par_p10
-               ) >> 17
-
-        calc_pressure = calc_pressure + (
-                (var1 + var2 + var3 + (self.calibration_data.par_p7 << 7)) >> 4
-        )
+        var1 = (p9 * (((calc_pressure >> 3) * (calc_pressure >> 3)) >> 13)) >> 12
+        var2 = ((calc_pressure >> 2) * p8) >> 13
+        pressure_256 = calc_pressure >> 8
+        var3 = (pressure_256 * pressure_256 * pressure_256 * p10) >> 17
 
-        return calc_pressure
+        return calc_pressure + ((var1 + var2 + var3 + p7_x128) >> 4)
 
     def _calc_humidity(self, humidity_adc):
+        h1_x16, h2, h3, h4, h5, h6_x128, h7 = self._humidity_coeffs
         temp_scaled = ((self.calibration_data.t_fine * 5) + 128) >> 8
-        var1 = (humidity_adc - (self.calibration_data.par_h1 * 16)) - (
-                ((temp_scaled * self.calibration_data.par_h3) // 100) >> 1
-        )
+        var1 = (humidity_adc - h1_x16) - (((temp_scaled * h3) // 100) >> 1)
         var2 = (
-                       self.calibration_data.par_h2
-                       * (
-                               ((temp_scaled * self.calibration_data.par_h4) // 100)
-                               + (
-                                       (
-                                               (
-                                                       temp_scaled
-                                                       * (
-                                                               (temp_scaled * self.calibration_data.par_h5)
-                                                               // 100
-                                                       )
-                                               )
-                                               >> 6
-                                       )
-                                       // 100
-                               )
-                               + (1 * 16384)
-                       )
-               ) >> 10
+            h2
+            * (
+                ((temp_scaled * h4) // 100)
+                + (((temp_scaled * ((temp_scaled * h5) // 100)) >> 6) // 100)
+                + 16384
+            )
+        ) >> 10
         var3 = var1 * var2
-        var4 = self.calibration_data.par_h6 << 7
-        var4 = (
-                       var4 + ((temp_scaled * self.calibration_data.par_h7) // 100)
-               ) >> 4
+        var4 = (h6_x128 + ((temp_scaled * h7) // 100)) >> 4
         var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
         var6 = (var4 * var5) >> 1
         calc_hum = (((var3 + var6) >> 10) * 1000) >> 12
@@ -412,16 +541,9 @@ class BME680(BME680Data):
         return min(max(calc_hum, 0), 100000)
 
     def _calc_gas_resistance(self, gas_res_adc, gas_range):
-        # sourcery skip: inline-immediately-returned-variable
-        var1 = (
-                       (1340 + (5 * self.calibration_data.range_sw_err))
-                       * (lookupTable1[gas_range])
-               ) >> 16
+        var1 = self._gas_var1[gas_range]
         var2 = ((gas_res_adc << 15) - 16777216) + var1
-        var3 = (lookupTable2[gas_range] * var1) >> 9
-        calc_gas_res = (var3 + (var2 >> 1)) / var2
-
-        return calc_gas_res
+        return (self._gas_var3[gas_range] + (var2 >> 1)) / var2
 
     def _calc_heater_resistance(self, temperature):
         temperature = min(max(temperature, 200), 400)
@@ -457,3 +579,34 @@ class BME680(BME680Data):
             return int(duration + (factor * 64))
 
         return 0xFF
+
+
+class HeaterProfileSequencer:
+    """Cycles the gas heater through a list of temperature/duration steps
+
+    Every step is written to its own heater profile slot once, advancing to
+    the next step is then a cached register change committed with the next
+    measurement.
+
+    :param sensor: A BME680 instance.
+    :param steps: (temperature in degrees Celsius, duration in milliseconds) pairs, at most 10.
+
+    """
+
+    def __init__(self, sensor, steps=((320, 150),)):
+        if not 0 < len(steps) <= NBCONV_MAX + 1:
+            raise ValueError(
+                "Between 1 and {} heater steps are supported".format(NBCONV_MAX + 1)
+            )
+        self.sensor = sensor
+        self.steps = steps
+        self._next = 0
+        for nb_profile, (temperature, duration) in enumerate(steps):
+            sensor.set_gas_heater_profile(temperature, duration, nb_profile=nb_profile)
+
+    def advance(self):
+        """Select the next step for the coming measurement and return its profile index"""
+        nb_profile = self._next
+        self.sensor.select_gas_heater_profile(nb_profile)
+        self._next = (nb_profile + 1) % len(self.steps)
+        return nb_profile
@@ -59,6 +59,18 @@ MEM_PAGE_ADDR = 0xF3
 CONF_T_P_MODE_ADDR = 0x74
 CONF_ODR_FILT_ADDR = 0x75
 
+# Sensor configuration registers cached by the driver, 0x70 to 0x75
+CONF_SHADOW_ADDR = CONF_HEAT_CTRL_ADDR
+CONF_SHADOW_LEN = 6
+# Burst write order of the cached registers, ctrl_meas (mode) last
+CONF_SHADOW_WRITE_ORDER = (
+    CONF_HEAT_CTRL_ADDR,
+    CONF_ODR_RUN_GAS_NBC_ADDR,
+    CONF_OS_H_ADDR,
+    CONF_ODR_FILT_ADDR,
+    CONF_T_P_MODE_ADDR,
+)
+
 # Coefficient's address
 COEFF_ADDR1 = 0x89
 COEFF_ADDR2 = 0xE1
@@ -102,6 +114,15 @@ FORCED_MODE = 1
 # Delay related macro declaration
 RESET_PERIOD = 10
 
+# Measurement duration, see calc_profile_dur in the Bosch BME68x API
+OS_MEAS_CYCLES = (0, 1, 2, 4, 8, 16)
+MEAS_CYCLE_DURATION_US = 1963
+TPH_SWITCHING_DURATION_US = 477 * 4
+GAS_MEAS_DURATION_US = 477 * 5
+WAKE_UP_DURATION_MS = 1
+# Extra polls of the new data flag once the computed duration has elapsed
+COLLECT_RETRIES = 3
+
 # SPI memory page settings
 MEM_PAGE0 = 0x10
 MEM_PAGE1 = 0x00
@@ -452,8 +473,8 @@ class BME680Data:
         self.intf = None
         # Memory page used
         self.mem_page = None
-        # Ambient temperature in Degree C
-        self.ambient_temperature = None
+        # Ambient temperature in Degree C, the Bosch reference assumes 25 until the first measurement
+        self.ambient_temperature = 25
         # Field Data
         self.data = FieldData()
         # Sensor calibration data
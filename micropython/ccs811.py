@@ -8,17 +8,57 @@ Tested on NodeMCU and Wemos D1 Mini (ESP8266) MicroPython v1.8.7-7-gb5a1a20a3
 and MicroPython v1.9.3-8-g63826ac5c in 2017-11-01; ESP module with ESP8266
 """
 
+import time
+
+from machine import Pin
+
+# Time between two results for each drive mode, see Figure 13 in datasheet.
+# Mode 4 (250 ms) only produces RAW_DATA, no eCO2 and TVOC results.
+DRIVE_MODE_PERIOD_MS = {1: 1000, 2: 10000, 3: 60000}
+# A running sensor has to idle (mode 0) this long before a slower drive mode
+MODE_SWITCH_IDLE_MS = 10 * 60 * 1000
+# Measure Mode Register (0x01): bits 6:4 drive mode, bit 3 nINT asserted on data ready
+_MEAS_MODE_INT_DATARDY = 0b00001000
+
+BASELINE_FILE = "ccs811_baseline"
+# The baseline is only meaningful once the sensor ran in for 20 minutes
+BASELINE_RUN_IN_S = 20 * 60
+BASELINE_SAVE_INTERVAL_S = 60 * 60
+# Older baselines no longer match the sensor, it learns a new one instead
+BASELINE_MAX_AGE_S = 24 * 60 * 60
+
 
 class CCS811(object):
-    """CCS811 gas sensor. Measures eCO2 in ppm and TVOC in ppb"""
+    """CCS811 gas sensor. Measures eCO2 in ppm and TVOC in ppb
+
+    The optional int_pin is the GPIO wired to nINT. The sensor pulls it low
+    when a result is ready until the result is read, so checking for new
+    data costs a pin read instead of an I2C transaction.
 
-    def __init__(self, i2c=None, addr=90):
+    mode is the drive mode, a result every DRIVE_MODE_PERIOD_MS[mode]. The
+    datasheet asks for 10 minutes in idle mode 0 before a running sensor
+    is switched to a slower mode: the sensor is then left idle and poll()
+    sets the mode once MODE_SWITCH_IDLE_MS passed, without results
+    meanwhile. A sensor already running in mode is left alone.
+    """
+
+    def __init__(self, i2c=None, addr=90, int_pin=None, mode=1):
         self.i2c = i2c
         self.addr = addr  # 0x5A = 90, 0x5B = 91
         self.tVOC = 0
         self.eCO2 = 0
-        self.mode = 1  # Constant power mode; measurement every second
+        if mode not in DRIVE_MODE_PERIOD_MS:
+            raise ValueError("Unsupported drive mode %d." % mode)
+        self.mode = mode
         self.error = False
+        self.int_pin = None if int_pin is None else Pin(int_pin, Pin.IN, Pin.PULL_UP)
+        # running sums of the results read since the last average()
+        self._eco2_sum = 0
+        self._tvoc_sum = 0
+        self._samples = 0
+        self.started = time.time()
+        self._baseline_saved = None
+        self._idle_since = None
 
         # Check if the sensor is available at i2c bus address
         devices = i2c.scan()
@@ -38,8 +78,24 @@ class CCS811(object):
             raise ValueError("Application not valid.")
         # Application start. Write with no data to App_Start (0xF4)
         self.i2c.writeto(self.addr, bytearray([0xF4]))
-        # Set drive mode 1 - see Figure 13 in datasheet: Measure Mode Register (0x01)
-        self.i2c.writeto_mem(self.addr, 0x01, bytearray([0b00011000]))
+        # Set the drive mode - see Figure 13 in datasheet: Measure Mode Register (0x01)
+        meas_mode = self.i2c.readfrom_mem(self.addr, 0x01, 1)[0]
+        running = (meas_mode >> 4) & 0x07
+        if meas_mode == self.mode << 4 | _MEAS_MODE_INT_DATARDY:
+            pass  # left running by the previous run, e.g. before a soft reset
+        elif running == 4 or (
+            running in DRIVE_MODE_PERIOD_MS
+            and DRIVE_MODE_PERIOD_MS[running] < DRIVE_MODE_PERIOD_MS[self.mode]
+        ):
+            self._set_drive_mode(0)
+            self._idle_since = time.ticks_ms()
+        else:
+            self._set_drive_mode(self.mode)
+
+    def _set_drive_mode(self, mode):
+        self.i2c.writeto_mem(
+            self.addr, 0x01, bytearray([mode << 4 | _MEAS_MODE_INT_DATARDY])
+        )
 
     def __string__(self):
         return "eCO2: %d ppm, TVOC: %d ppb" % (s.eCO2, s.tVOC)
@@ -61,6 +117,54 @@ class CCS811(object):
         else:
             return False
 
+    def poll(self):
+        """Reads a new result if one is ready and adds it to the running
+        average. Returns True if a result was read."""
+        if self._idle_since is not None:
+            # switching to a slower drive mode, see the class docstring
+            if time.ticks_diff(time.ticks_ms(), self._idle_since) < MODE_SWITCH_IDLE_MS:
+                return False
+            self._set_drive_mode(self.mode)
+            self._idle_since = None
+            return False
+        if self.int_pin is not None and self.int_pin.value():
+            return False  # nINT is only asserted (low) while a result is waiting
+        if not self.data_ready():
+            return False
+        self._eco2_sum += self.eCO2
+        self._tvoc_sum += self.tVOC
+        self._samples += 1
+        return True
+
+    def wait(self, timeout_ms=None):
+        """Polls until a new result is read, at most timeout_ms (two drive
+        mode periods by default). Returns True if a result was read."""
+        period_ms = DRIVE_MODE_PERIOD_MS[self.mode]
+        if timeout_ms is None:
+            timeout_ms = 2 * period_ms
+        # without nINT every check is an I2C read, spread them over the period
+        poll_ms = 10 if self.int_pin is not None else period_ms // 10
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        while not self.poll():
+            if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+                return False
+            time.sleep_ms(poll_ms)
+        return True
+
+    def average(self):
+        """Returns the average (eCO2, TVOC) of the results read since the
+        last call and starts a new average, None if no result was read."""
+        if not self._samples:
+            return None
+        averages = (
+            round(self._eco2_sum / self._samples),
+            round(self._tvoc_sum / self._samples),
+        )
+        self._eco2_sum = 0
+        self._tvoc_sum = 0
+        self._samples = 0
+        return averages
+
     def get_baseline(self):
         register = self.i2c.readfrom_mem(self.addr, 0x11, 2)
         hb = register[0]
@@ -73,6 +177,44 @@ class CCS811(object):
         register[1] = lb
         self.i2c.writeto_mem(self.addr, 0x11, register)
 
+    def save_baseline(self, path=BASELINE_FILE):
+        """Writes the current baseline and the current time to flash"""
+        hb, lb = self.get_baseline()
+        now = time.time()
+        with open(path, "w") as baseline_file:
+            baseline_file.write("%d %d %d\n" % (hb, lb, now))
+        self._baseline_saved = now
+
+    def restore_baseline(self, path=BASELINE_FILE, max_age_s=BASELINE_MAX_AGE_S):
+        """Writes the baseline saved in flash back to the sensor, returns
+        False if there is none or it is older than max_age_s"""
+        try:
+            with open(path) as baseline_file:
+                hb, lb, saved = (
+                    int(value) for value in baseline_file.readline().split()
+                )
+        except (OSError, ValueError):
+            return False
+        # a negative age means the clock restarted with a power loss
+        if not 0 <= time.time() - saved <= max_age_s:
+            return False
+        self.put_baseline(hb, lb)
+        return True
+
+    def persist_baseline(self, path=BASELINE_FILE):
+        """Saves the baseline once the sensor ran in, then every
+        BASELINE_SAVE_INTERVAL_S. Returns True if it was saved"""
+        now = time.time()
+        if now - self.started < BASELINE_RUN_IN_S:
+            return False
+        if (
+            self._baseline_saved is not None
+            and now - self._baseline_saved < BASELINE_SAVE_INTERVAL_S
+        ):
+            return False
+        self.save_baseline(path)
+        return True
+
     def put_env_data(self, humidity, temp):
         env_register = bytearray([0x00, 0x00, 0x00, 0x00])
         env_register[0] = int(humidity) << 1
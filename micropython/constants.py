@@ -7,3 +7,8 @@ API_KEY = ""
 PARTICLE_SENSOR = "PTQS1005"
 TEMP_HUM_PRESS_SENSOR = "BME680"
 TVOC_CO2_SENSOR = ""
+SDS011_WORKING_PERIOD = 0  # minutes, 1-30 lets the SDS011 run its fan on its own
+BME680_HEATER_PROFILE = ((320, 150),)  # (temperature C, duration ms) gas heater steps
+CCS811_INT_PIN = None  # GPIO wired to the CCS811 nINT output
+CCS811_POLL_INTERVAL = 10  # seconds, the CCS811 reports every 10 s
+I2C_FREQUENCY = 100000  # Hz, up to 400000 with short I2C wires and strong pull-ups
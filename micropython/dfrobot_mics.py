@@ -21,9 +21,50 @@ _MICS_POWER_REGISTER_MODE = 0x0A
 _MICS_SLEEP_MODE = 0x00
 _MICS_WAKEUP_MODE = 0x01
 
+# Warm-up states, see Mics.tick
+MICS_UNCALIBRATED = 0
+MICS_WARMING_UP = 1
+MICS_CALIBRATING = 2
+MICS_READY = 3
+
+_MICS_WARM_UP_MS = 180000
+_MICS_CALIBRATION_SAMPLES = 10
+_MICS_CALIBRATION_INTERVAL_MS = 1000
+
+# R0 tracking, the red resistance is highest and the ox resistance lowest in clean air:
+# the baseline follows readings towards clean air quickly and away from it slowly
+_MICS_BASELINE_FAST = 0.05
+_MICS_BASELINE_SLOW = 0.001
+_MICS_BASELINE_FILE = "mics_baseline"
+# well inside the max age, a loop can take minutes with a sampling particle or sound sensor
+_MICS_BASELINE_SAVE_INTERVAL_MS = 600000
+_MICS_BASELINE_MAX_AGE_S = 3600  # saved baselines older than this need a new warm-up
+
 _MICS_CO_THRESHOLD = 0.425
 _MICS_CO_FACTOR = 0.000405
 
+# gas: (conversion method, True if computed from the ox ratio instead of the red ratio)
+_MICS_PPM_GASES = {
+    "CO": ("get_carbon_monoxide", False),
+    "CH4": ("get_methane", False),
+    "C2H5OH": ("get_ethanol", False),
+    "H2": ("get_hydrogen", False),
+    "NH3": ("get_ammonia", False),
+    "NO2": ("get_nitrogen_dioxide", True),
+}
+_MICS_EXIST_GASES = {
+    "CO": ("exist_carbon_monoxide", False),
+    "CH4": ("exist_methane", False),
+    "C2H5OH": ("exist_ethanol", False),
+    "C3H8": ("exist_propane", False),
+    "C4H10": ("exist_iso_butane", False),
+    "H2": ("exist_hydrogen", False),
+    "H2S": ("exist_hydrogen_sulfide", False),
+    "NH3": ("exist_ammonia", False),
+    "NO": ("exist_nitric_oxide", True),
+    "NO2": ("exist_nitrogen_dioxide", True),
+}
+
 
 class Mics(object):
     __r0_ox = 1.0
@@ -32,6 +73,20 @@ class Mics(object):
     def __init__(self, i2c: I2CAdapter):
         self.i2c = i2c
         self.addr = _MICS_ADDRESS_0
+        # reused by get_all_gas_ppm and get_all_gas_exist
+        self._gas_ppm = {gas: 0.0 for gas in _MICS_PPM_GASES}
+        self._gas_exist = {gas: None for gas in _MICS_EXIST_GASES}
+        # reused by get_mics_data
+        self._raw_data = bytearray(6)
+        self._sensor_data = [0] * 3
+        # no gas is reported before start_warm_up or restore_baseline calibrated the sensor
+        self.state = MICS_UNCALIBRATED
+        self._state_since = 0
+        self._last_sample = 0
+        self._samples = 0
+        self._ox_sum = 0
+        self._red_sum = 0
+        self._last_save = time.ticks_ms()
 
     def sleep_mode(self):
         """
@@ -55,6 +110,17 @@ class Mics(object):
             self.addr, _MICS_POWER_REGISTER_MODE, bytes(_data)
         )
 
+    def is_awake(self):
+        """
+        Functionality:
+            Checks if the MICS sensor is in wakeup mode, e.g. because the board restarted while the sensor
+            kept its heater running.
+
+        Returns:
+            bool: True if the sensor is in wakeup mode
+        """
+        return self.get_power_mode() == _MICS_WAKEUP_MODE
+
     def get_power_mode(self):
         """
         Functionality:
@@ -71,10 +137,10 @@ class Mics(object):
         """
         Functionality:
             Retrieves MICS sensor data by reading 6 bytes from the I2C bus starting from the _MICS_OX_REGISTER_HIGH register.
-            The sensor data is stored in a list, where:
-            - sensor_data[0] and sensor_data[1] represent the ox_data (high and low bytes)
-            - sensor_data[2] and sensor_data[3] represent the red_data (high and low bytes)
-            - sensor_data[4] and sensor_data[5] represent the power_data (high and low bytes)
+            The raw bytes are read into a reused buffer, where:
+            - raw[0] and raw[1] represent the ox_data (high and low bytes)
+            - raw[2] and raw[3] represent the red_data (high and low bytes)
+            - raw[4] and raw[5] represent the power_data (high and low bytes)
 
             The method calculates the actual ox_data, red_data, and power_data by combining the high and low bytes.
             It then updates sensor_data[0] with the difference between power_data and ox_data, if the difference is positive, otherwise sets it to 0.
@@ -82,17 +148,17 @@ class Mics(object):
             Finally, it updates sensor_data[2] with the power_data.
 
         Returns:
-            list: A list containing the updated sensor data, where:
+            list: A list containing the updated sensor data, reused by the next call, where:
             - sensor_data[0] represents the adjusted ox_data
             - sensor_data[1] represents the adjusted red_data
             - sensor_data[2] represents the power_data
         """
-        sensor_data = list(
-            self.i2c.read_i2c_block_data(self.addr, _MICS_OX_REGISTER_HIGH, 6)
-        )
-        ox_data = sensor_data[0] * 256 + sensor_data[1]
-        red_data = sensor_data[2] * 256 + sensor_data[3]
-        power_data = sensor_data[4] * 256 + sensor_data[5]
+        raw = self._raw_data
+        self.i2c.read_into(self.addr, _MICS_OX_REGISTER_HIGH, raw)
+        sensor_data = self._sensor_data
+        ox_data = raw[0] << 8 | raw[1]
+        red_data = raw[2] << 8 | raw[3]
+        power_data = raw[4] << 8 | raw[5]
         if (power_data - ox_data) <= 0:
             sensor_data[0] = 0
         else:
@@ -104,72 +170,217 @@ class Mics(object):
         sensor_data[2] = power_data
         return sensor_data
 
-    def get_gas_ppm(self, gas_type: str):
-        try:
-            result = self.get_mics_data()
+    def _get_ratios(self):
+        """
+        Functionality:
+            Reads the sensor once and divides the red and ox values by their R0 baseline.
+
+        Returns:
+            tuple: The (rs/r0 red, rs/r0 ox) ratios, or None if the sensor is not calibrated or the R0 values
+            are zero.
+        """
+        if self.state != MICS_READY:
+            logging.warning("MICS sensor is not calibrated yet")
+            return None
+        if self.__r0_red == 0 or self.__r0_ox == 0:
+            logging.error("R0 values are zero. Sensor may not be properly calibrated.")
+            return None
+        result = self.get_mics_data()
+        ratios = (
+            float(result[1]) / float(self.__r0_red),
+            float(result[0]) / float(self.__r0_ox),
+        )
+        self._track_baseline(result[0], result[1])
+        return ratios
+
+    def _track_baseline(self, ox, red):
+        """
+        Parameters:
+            ox (int): The adjusted ox reading
+            red (int): The adjusted red reading
+
+        Functionality:
+            Updates the R0 values with an asymmetric exponentially weighted moving average of the readings,
+            fast towards clean air (higher red, lower ox) and slow away from it, so R0 follows the drift of
+            the sensor without being pulled by pollution episodes. The baseline is saved to flash every
+            _MICS_BASELINE_SAVE_INTERVAL_MS, however often the sensor is read.
+        """
+        weight = _MICS_BASELINE_FAST if red > self.__r0_red else _MICS_BASELINE_SLOW
+        self.__r0_red += weight * (red - self.__r0_red)
+        weight = _MICS_BASELINE_FAST if ox < self.__r0_ox else _MICS_BASELINE_SLOW
+        self.__r0_ox += weight * (ox - self.__r0_ox)
+
+        if (
+            time.ticks_diff(time.ticks_ms(), self._last_save)
+            >= _MICS_BASELINE_SAVE_INTERVAL_MS
+        ):
+            self.save_baseline()
 
-            if self.__r0_red == 0 or self.__r0_ox == 0:
-                logging.error(
-                    "R0 values are zero. Sensor may not be properly calibrated."
+    def save_baseline(self, path=_MICS_BASELINE_FILE):
+        """
+        Functionality:
+            Writes the R0 values and the current time to flash, errors are logged and ignored.
+        """
+        self._last_save = time.ticks_ms()
+        try:
+            with open(path, "w") as baseline_file:
+                baseline_file.write(
+                    f"{self.__r0_ox} {self.__r0_red} {int(time.time())}\n"
                 )
-                return _MICS_ERROR
+        except OSError as e:
+            logging.error(f"Failed to save MICS baseline: {str(e)}")
 
-            rs_r0_red_data = (
-                float(result[1]) / float(self.__r0_red) if self.__r0_red != 0 else 0
-            )
-            rs_ro_ox_data = (
-                float(result[0]) / float(self.__r0_ox) if self.__r0_ox != 0 else 0
-            )
-
-            gas_getters = {
-                "CO": self.get_carbon_monoxide(rs_r0_red_data),
-                "CH4": self.get_methane(rs_r0_red_data),
-                "C2H5OH": self.get_ethanol(rs_r0_red_data),
-                "H2": self.get_hydrogen(rs_r0_red_data),
-                "NH3": self.get_ammonia(rs_r0_red_data),
-                "NO2": self.get_nitrogen_dioxide(rs_ro_ox_data),
-            }
-
-            if gas_type in gas_getters:
-                return gas_getters[gas_type]
+    def restore_baseline(
+        self, path=_MICS_BASELINE_FILE, max_age_s=_MICS_BASELINE_MAX_AGE_S
+    ):
+        """
+        Parameters:
+            path (str): The file written by save_baseline
+            max_age_s (int): The maximum age of the saved baseline in seconds
 
-            logging.warning(f"Unsupported gas type: {gas_type}")
-            return _MICS_ERROR
+        Functionality:
+            Restores the R0 values saved by save_baseline and marks the sensor calibrated, skipping the warm-up.
+            Only use it when the sensor heater kept running, see is_awake.
+
+        Returns:
+            bool: True if a recent enough baseline was restored.
+        """
+        try:
+            with open(path) as baseline_file:
+                r0_ox, r0_red, saved = baseline_file.readline().split()
+            r0_ox, r0_red, age = float(r0_ox), float(r0_red), time.time() - int(saved)
+        except (OSError, ValueError):
+            return False
+        # a negative age means the clock restarted with a power loss
+        if not 0 <= age <= max_age_s or r0_ox <= 0 or r0_red <= 0:
+            return False
+        self.__r0_ox = r0_ox
+        self.__r0_red = r0_red
+        self.state = MICS_READY
+        return True
+
+    def get_gas_ppm(self, gas_type: str):
+        """
+        Parameters:
+            gas_type (str): The gas to measure, one of CO, CH4, C2H5OH, H2, NH3 or NO2
 
-        except ZeroDivisionError:
-            logging.error(
-                "ZeroDivisionError in get_gas_ppm. Sensor values may be invalid."
-            )
+        Functionality:
+            Reads the sensor and converts the ratio of the requested gas only.
+            Use get_all_gas_ppm to measure several gases with a single read.
+
+        Returns:
+            float or str: The gas concentration in ppm, or _MICS_ERROR.
+        """
+        if gas_type not in _MICS_PPM_GASES:
+            logging.warning(f"Unsupported gas type: {gas_type}")
             return _MICS_ERROR
+        try:
+            ratios = self._get_ratios()
+            if ratios is None:
+                return _MICS_ERROR
+            conversion, uses_ox = _MICS_PPM_GASES[gas_type]
+            return getattr(self, conversion)(ratios[1] if uses_ox else ratios[0])
         except Exception as e:
             logging.error(f"Unexpected error in get_gas_ppm: {str(e)}")
             return _MICS_ERROR
 
-    def warm_up_time(self):
+    def get_all_gas_ppm(self):
         """
         Functionality:
-            Performs a warm-up routine for the MICS sensor.
-            The warm-up routine consists of the following steps:
-            1. Wait for a calibration time of 180 seconds.
-            2. Retrieve the MICS sensor data using the `get_mics_data` method.
-            3. Iterates 10 times:
-            - Accumulates the ox and red values from the sensor data.
-            - Waits for 1 second between each iteration.
-            4. Calculates the average ox and red values by dividing the accumulated values by 10.
-            5. Stores the average ox and red values in the `__r0_ox` and `__r0_red` instance variables, respectively.
+            Reads the sensor once and converts the ratios to the concentration of every gas
+            supported by get_gas_ppm.
+
+        Returns:
+            dict or None: The concentration in ppm by gas name, or None if the sensor could not be read
+            or is not calibrated. The dictionary is reused by the next call.
         """
-        calibration_time = 180
-        for _ in range(calibration_time):
-            time.sleep(1)
+        try:
+            ratios = self._get_ratios()
+        except Exception as e:
+            logging.error(f"Unexpected error in get_all_gas_ppm: {str(e)}")
+            return None
+        if ratios is None:
+            return None
+        rs_r0_red_data, rs_ro_ox_data = ratios
+        gas_ppm = self._gas_ppm
+        gas_ppm["CO"] = self.get_carbon_monoxide(rs_r0_red_data)
+        gas_ppm["CH4"] = self.get_methane(rs_r0_red_data)
+        gas_ppm["C2H5OH"] = self.get_ethanol(rs_r0_red_data)
+        gas_ppm["H2"] = self.get_hydrogen(rs_r0_red_data)
+        gas_ppm["NH3"] = self.get_ammonia(rs_r0_red_data)
+        gas_ppm["NO2"] = self.get_nitrogen_dioxide(rs_ro_ox_data)
+        return gas_ppm
+
+    def start_warm_up(self):
+        """
+        Functionality:
+            Starts the non-blocking warm-up routine of the MICS sensor, advanced by `tick`.
+        """
+        self.state = MICS_WARMING_UP
+        self._state_since = time.ticks_ms()
 
-        for _ in range(10):
-            result = self.get_mics_data()
-            self.__r0_ox += result[0]
-            self.__r0_red += result[1]
-            time.sleep(1)
+    def tick(self):
+        """
+        Functionality:
+            Advances the warm-up routine started by `start_warm_up`, without blocking.
+            The routine consists of the following states:
+            0. MICS_UNCALIBRATED: the warm-up has not been started, nothing to do.
+            1. MICS_WARMING_UP: waits until 180 seconds passed since the warm-up started.
+            2. MICS_CALIBRATING: takes one sample per call, at least 1 second apart, accumulating the ox and red values.
+               After 10 samples the averages are stored in the `__r0_ox` and `__r0_red` instance variables.
+            3. MICS_READY: the sensor is calibrated, nothing left to do.
+            Call it regularly, e.g. once per loop and between sleep slices.
 
-        self.__r0_ox //= 10
-        self.__r0_red //= 10
+        Returns:
+            bool: True once the sensor is calibrated.
+        """
+        if self.state == MICS_READY:
+            return True
+        if self.state == MICS_UNCALIBRATED:
+            return False
+
+        now = time.ticks_ms()
+        if self.state == MICS_WARMING_UP:
+            if time.ticks_diff(now, self._state_since) < _MICS_WARM_UP_MS:
+                return False
+            logging.info("MICS sensor warmed up, calibrating")
+            self.state = MICS_CALIBRATING
+            self._state_since = now
+            self._samples = 0
+            self._ox_sum = 0
+            self._red_sum = 0
+
+        if (
+            self._samples
+            and time.ticks_diff(now, self._last_sample) < _MICS_CALIBRATION_INTERVAL_MS
+        ):
+            return False
+        result = self.get_mics_data()
+        self._ox_sum += result[0]
+        self._red_sum += result[1]
+        self._samples += 1
+        self._last_sample = now
+        if self._samples < _MICS_CALIBRATION_SAMPLES:
+            return False
+
+        self.__r0_ox = self._ox_sum / _MICS_CALIBRATION_SAMPLES
+        self.__r0_red = self._red_sum / _MICS_CALIBRATION_SAMPLES
+        self.state = MICS_READY
+        logging.info(
+            f"MICS sensor calibrated, R0 ox {self.__r0_ox} red {self.__r0_red}"
+        )
+        self.save_baseline()
+        return True
+
+    def warm_up_time(self):
+        """
+        Functionality:
+            Performs the warm-up routine of `tick` for the MICS sensor, blocking until the sensor is calibrated
+            (about 190 seconds).
+        """
+        self.start_warm_up()
+        while not self.tick():
+            time.sleep(1)
 
     def get_gas_exist(self, gas_type):
         """
@@ -178,36 +389,49 @@ class Mics(object):
 
         Functionality:
             Retrieves MICS sensor data using the `get_mics_data` method.
-            Calculates the ratios of rs/r0 for the red and ox values.
-            Checks for the existence of the specified gas type using the corresponding exist_* method based on the gas_type.
-            Returns the result of the exist_* method if the gas_type is found in the gas_getters dictionary.
-            If the gas_type is not found, returns _MICS_ERROR.
+            Calculates the ratio of rs/r0 used by the specified gas type and checks it with the
+            corresponding exist_* method only.
+            If the gas_type is not supported or the sensor is not calibrated, returns _MICS_ERROR.
 
         Returns:
             int or None: Returns 1 if the specified gas exists, None if it doesn't exist, or _MICS_ERROR if the gas_type is not supported.
         """
+        if gas_type not in _MICS_EXIST_GASES or self.state != MICS_READY:
+            return _MICS_ERROR
+
         result = self.get_mics_data()
+        check, uses_ox = _MICS_EXIST_GASES[gas_type]
+        if uses_ox:
+            return getattr(self, check)(result[0] / self.__r0_ox)
+        return getattr(self, check)(result[1] / self.__r0_red)
+
+    def get_all_gas_exist(self):
+        """
+        Functionality:
+            Reads the sensor once and checks the existence of every gas supported by get_gas_exist.
 
+        Returns:
+            dict or None: 1 or None by gas name, see get_gas_exist, or None if the sensor is not calibrated.
+            The dictionary is reused by the next call.
+        """
+        if self.state != MICS_READY:
+            return None
+        result = self.get_mics_data()
         rs_r0_red_ratio = result[1] / self.__r0_red
         rs_ro_ox_ratio = result[0] / self.__r0_ox
 
-        gas_getters = {
-            "CO": self.exist_carbon_monoxide(rs_r0_red_ratio),
-            "CH4": self.exist_methane(rs_r0_red_ratio),
-            "C2H5OH": self.exist_ethanol(rs_r0_red_ratio),
-            "C3H8": self.exist_propane(rs_r0_red_ratio),
-            "C4H10": self.exist_iso_butane(rs_r0_red_ratio),
-            "H2": self.exist_hydrogen(rs_r0_red_ratio),
-            "H2S": self.exist_hydrogen_sulfide(rs_r0_red_ratio),
-            "NH3": self.exist_ammonia(rs_r0_red_ratio),
-            "NO": self.exist_nitric_oxide(rs_ro_ox_ratio),
-            "NO2": self.exist_nitrogen_dioxide(rs_ro_ox_ratio),
-        }
-
-        if gas_type in gas_getters.keys():
-            return gas_getters.get(gas_type)
-
-        return _MICS_ERROR
+        gas_exist = self._gas_exist
+        gas_exist["CO"] = self.exist_carbon_monoxide(rs_r0_red_ratio)
+        gas_exist["CH4"] = self.exist_methane(rs_r0_red_ratio)
+        gas_exist["C2H5OH"] = self.exist_ethanol(rs_r0_red_ratio)
+        gas_exist["C3H8"] = self.exist_propane(rs_r0_red_ratio)
+        gas_exist["C4H10"] = self.exist_iso_butane(rs_r0_red_ratio)
+        gas_exist["H2"] = self.exist_hydrogen(rs_r0_red_ratio)
+        gas_exist["H2S"] = self.exist_hydrogen_sulfide(rs_r0_red_ratio)
+        gas_exist["NH3"] = self.exist_ammonia(rs_r0_red_ratio)
+        gas_exist["NO"] = self.exist_nitric_oxide(rs_ro_ox_ratio)
+        gas_exist["NO2"] = self.exist_nitrogen_dioxide(rs_ro_ox_ratio)
+        return gas_exist
 
     @staticmethod
     def get_carbon_monoxide(sensor_value):
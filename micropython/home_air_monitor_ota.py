@@ -8,35 +8,58 @@ for handler in logging.getLogger().handlers:
     handler.setFormatter(logging.Formatter("[%(levelname)s]:%(name)s:%(message)s"))
 
 
+OTA_HOST = 'https://static.airmonitor.pl'
+PROJECT_NAME = 'home_air_monitor_micropython'
+
+
 def ota_updater():
-    ota_host = 'https://static.airmonitor.pl'
-    project_name = 'home_air_monitor_micropython'
     filenames = [
+        "aggregation.py",
         "bme280.py",
         "bme680.py",
         "bme680_constants.py",
         "boot.py",
         "ccs811.py",
         "connect_wifi.py",
+        "dfrobot_mics.py",
         "errors.py",
         "home_air_monitor_ota.py",
         "i2c.py",
+        "iaq.py",
         "main.py",
         "micropython_ota.py",
+        "pcb_artist_sound_level.py",
         "pms7003.py",
         "ptqs1005.py",
         "sds011.py",
+        "uart_frame.py",
         "wifi_connection.py",
     ]
     logging.info("Starting OTA updater")
 
     micropython_ota.ota_update(
-        ota_host,
-        project_name,
+        OTA_HOST,
+        PROJECT_NAME,
         filenames,
         use_version_prefix=True,
         hard_reset_device=True,
         soft_reset_device=False,
-        timeout=5
+        timeout=5,
+        compressed=True,
+        verify_hashes=True
     )
     logging.info("OTA finished")
+
+
+def ota_check():
+    """Checks for a new release without downloading it.
+
+    The version file is requested conditionally (ETag / Last-Modified), so
+    polling from the main loop costs a single 304 response when nothing
+    changed. When a new version is published the device is reset and the
+    update is installed by ota_updater() during boot. A version that could
+    not be installed at boot only resets the device again after a backoff,
+    so a broken release does not reboot every station once per hour.
+    """
+    logging.info("Checking for OTA update")
+    micropython_ota.check_for_ota_update(OTA_HOST, PROJECT_NAME, timeout=5)
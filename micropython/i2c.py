@@ -1,32 +1,323 @@
-from machine import SoftI2C
+import time
 
+from machine import I2C, SoftI2C
 
-class I2CAdapter(SoftI2C):
+try:
+    from _thread import allocate_lock, get_ident
+except ImportError:
+    # Ports without threads only interleave at uasyncio await points, which never split a transaction
+    allocate_lock = None
+
+    def get_ident():
+        return 0
+
+# Standard mode, works with long wires and weak pull-ups
+DEFAULT_FREQUENCY = 100000
+# Fast mode, the highest speed supported by every sensor on the bus
+MAX_FREQUENCY = 400000
+
+
+class I2CAdapter:
     """Adds some of the SMBus I2c methods to the micropython I2c class,
         for enhanced compatibility.
         Use it like you would the machine.I2C class:
 
-        From bme680.i2c import I2CAdapter
-        I2c_dev = I2CAdapter(1, pins=('G15','G10'), baudrate=100000)
+        from i2c import I2CAdapter
+        i2c_dev = I2CAdapter(scl=Pin(22), sda=Pin(21), freq=400000)
         sensor = bme680.BME680(i2c_device=i2c_dev)
+
+        The hardware I2C peripheral bus_id is used when it can be set up on
+        the given pins, otherwise the bus is bit-banged with SoftI2C.
         """
 
+    def __init__(self, bus_id=0, scl=None, sda=None, freq=DEFAULT_FREQUENCY, hardware=True):
+        if freq > MAX_FREQUENCY:
+            raise ValueError("I2C frequency above {} Hz".format(MAX_FREQUENCY))
+        self.bus = None
+        if hardware:
+            try:
+                self.bus = I2C(bus_id, scl=scl, sda=sda, freq=freq)
+            except (ValueError, OSError):
+                self.bus = None
+        self.hardware = self.bus is not None
+        if self.bus is None:
+            self.bus = SoftI2C(scl=scl, sda=sda, freq=freq)
+        self.freq = freq
+
+        # The machine.I2C methods are bound once, calling them costs no extra Python frame
+        self.scan = self.bus.scan
+        self.readfrom = self.bus.readfrom
+        self.readfrom_into = self.bus.readfrom_into
+        self.writeto = self.bus.writeto
+        self.readfrom_mem = self.bus.readfrom_mem
+        self.readfrom_mem_into = self.bus.readfrom_mem_into
+        self.writeto_mem = self.bus.writeto_mem
+
+        # scratch buffers of the single byte helpers, they allocate nothing per call
+        self._read_byte = bytearray(1)
+        self._write_byte = bytearray(1)
+
+    def __repr__(self):
+        return "I2CAdapter({}, freq={})".format(
+            "hardware" if self.hardware else "software", self.freq
+        )
+
     def read_byte_data(self, addr, register):
         """ Read a single byte from register of device at addr
             Returns a single byte """
-        return self.readfrom_mem(addr, register, 1)[0]
+        self.readfrom_mem_into(addr, register, self._read_byte)
+        return self._read_byte[0]
 
     def read_i2c_block_data(self, addr, register, length):
         """ Read a block of length from register of device at addr
             Returns a byte object filled with whatever was read """
         return self.readfrom_mem(addr, register, length)
 
+    def read_into(self, addr, register, buf):
+        """ Read len(buf) bytes from register of device at addr into buf
+            Returns None """
+        return self.readfrom_mem_into(addr, register, buf)
+
     def write_byte_data(self, addr, register, data):
         """ Write a single byte of data to register of device at addr
             Returns None """
-        return self.writeto_mem(addr, register, bytes([data]))
+        self._write_byte[0] = data
+        return self.writeto_mem(addr, register, self._write_byte)
 
     def write_i2c_block_data(self, addr, register, data):
         """ Write multiple bytes of data to register of device at addr
             Returns None """
         return self.writeto_mem(addr, register, data)
+
+
+class _NoLock:
+    def acquire(self, *args):
+        return True
+
+    def release(self):
+        pass
+
+
+class _Batch:
+    """Context manager holding the bus for consecutive transactions of one device."""
+
+    def __init__(self, arbiter, addr):
+        self.arbiter = arbiter
+        self.addr = addr
+
+    def __enter__(self):
+        arbiter = self.arbiter
+        if arbiter._holder == get_ident():
+            raise RuntimeError("I2C batch already open")
+        arbiter._lock.acquire()
+        arbiter._holder = get_ident()
+        arbiter._batch_addr = self.addr
+        return arbiter
+
+    def __exit__(self, *exc_info):
+        arbiter = self.arbiter
+        arbiter._holder = None
+        arbiter._batch_addr = None
+        arbiter._lock.release()
+        return False
+
+
+class I2CArbiter:
+    """Serialises the transactions of the drivers sharing one I2CAdapter.
+
+        Every transaction runs under a lock and its bus time is accounted
+        to the device address, so timer callbacks and uasyncio tasks can
+        sample sensors concurrently and stats() shows which device uses the
+        bus. It has the same methods as I2CAdapter and is handed to the
+        drivers instead of it:
+
+        i2c_dev = I2CArbiter(I2CAdapter(scl=Pin(22), sda=Pin(21)))
+        with i2c_dev.batch(0x77):
+            i2c_dev.write_byte_data(0x77, 0x74, 0x25)
+            i2c_dev.read_into(0x77, 0x1D, buf)
+
+        Callbacks that may not touch the bus themselves, such as timer
+        interrupts scheduled with micropython.schedule, submit() a
+        transaction to the queue of their device instead; service() runs
+        the queued transactions, one per device in turn.
+        """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self._lock = allocate_lock() if allocate_lock else _NoLock()
+        self._holder = None
+        self._batch_addr = None
+        self._queues = {}
+        # address -> [transactions, bus time in us]
+        self.usage = {}
+
+    def __repr__(self):
+        return "I2CArbiter({})".format(self.adapter)
+
+    def _begin(self, addr):
+        """ Take the bus for a transaction of the device at addr
+            Returns True if the lock has to be released by _end """
+        # get_ident() can return a heap allocated int, it is only asked while a batch is open
+        if self._holder is not None and self._holder == get_ident():
+            if addr != self._batch_addr:
+                raise RuntimeError("I2C batch of 0x{:02x} used for 0x{:02x}".format(self._batch_addr, addr))
+            return False
+        self._lock.acquire()
+        return True
+
+    def _end(self, addr, start, locked):
+        """ Account the transaction started at start (us) to the device at addr
+            and release the bus, the usage is updated while the bus is still held """
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        usage = self.usage.get(addr)
+        if usage is None:
+            self.usage[addr] = [1, elapsed]
+        else:
+            usage[0] += 1
+            usage[1] += elapsed
+        if locked:
+            self._lock.release()
+
+    def batch(self, addr):
+        """ Hold the bus for consecutive transactions of the device at addr
+            Returns a context manager """
+        return _Batch(self, addr)
+
+    def submit(self, addr, callback, *args):
+        """ Queue callback(self, *args) as a transaction of the device at addr
+            Returns the number of transactions queued for that device """
+        queue = self._queues.get(addr)
+        if queue is None:
+            queue = self._queues[addr] = []
+        queue.append((callback, args))
+        return len(queue)
+
+    def pending(self):
+        """ Returns the number of queued transactions of all devices """
+        return sum(len(queue) for queue in self._queues.values())
+
+    def service(self):
+        """ Run the queued transactions, taking one from every device in turn
+            so a busy device cannot starve the others
+            Returns the number of transactions run """
+        count = 0
+        while True:
+            ran = False
+            for addr, queue in self._queues.items():
+                if queue:
+                    callback, args = queue.pop(0)
+                    with self.batch(addr):
+                        callback(self, *args)
+                    count += 1
+                    ran = True
+            if not ran:
+                return count
+
+    def stats(self):
+        """ Returns the transactions and bus time of every device as a string """
+        return ", ".join(
+            "0x{:02x}: {} transactions {} us".format(addr, usage[0], usage[1])
+            for addr, usage in sorted(self.usage.items())
+        )
+
+    def reset_stats(self):
+        self.usage = {}
+
+    def scan(self):
+        if self._holder is not None and self._holder == get_ident():
+            return self.adapter.scan()
+        self._lock.acquire()
+        try:
+            return self.adapter.scan()
+        finally:
+            self._lock.release()
+
+    # The wrappers spell out their arguments and call the adapter directly, a generic wrapper
+    # would allocate an argument tuple and a bound method on every transaction
+    def readfrom(self, addr, nbytes, stop=True):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.readfrom(addr, nbytes, stop)
+        finally:
+            self._end(addr, start, locked)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.readfrom_into(addr, buf, stop)
+        finally:
+            self._end(addr, start, locked)
+
+    def writeto(self, addr, buf, stop=True):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.writeto(addr, buf, stop)
+        finally:
+            self._end(addr, start, locked)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.readfrom_mem(addr, memaddr, nbytes, addrsize=addrsize)
+        finally:
+            self._end(addr, start, locked)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+        finally:
+            self._end(addr, start, locked)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+        finally:
+            self._end(addr, start, locked)
+
+    def read_byte_data(self, addr, register):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.read_byte_data(addr, register)
+        finally:
+            self._end(addr, start, locked)
+
+    def read_i2c_block_data(self, addr, register, length):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.read_i2c_block_data(addr, register, length)
+        finally:
+            self._end(addr, start, locked)
+
+    def read_into(self, addr, register, buf):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.read_into(addr, register, buf)
+        finally:
+            self._end(addr, start, locked)
+
+    def write_byte_data(self, addr, register, data):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.write_byte_data(addr, register, data)
+        finally:
+            self._end(addr, start, locked)
+
+    def write_i2c_block_data(self, addr, register, data):
+        locked = self._begin(addr)
+        start = time.ticks_us()
+        try:
+            return self.adapter.write_i2c_block_data(addr, register, data)
+        finally:
+            self._end(addr, start, locked)
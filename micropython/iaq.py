@@ -0,0 +1,123 @@
+"""
+Open indoor air quality (IAQ) estimate for the BME680.
+
+The BME680 only reports the resistance of its metal oxide gas sensor,
+which drops when volatile organic compounds are present and also with
+rising humidity. IAQEstimator compensates the resistance for humidity,
+tracks a clean air baseline as an exponentially weighted moving average
+and scores every sample against it. Only the baseline and a counter are
+kept, and the baseline is written to flash now and then so a reset does
+not restart the calibration. A baseline saved too long ago, or before a
+power loss restarted the clock, is dropped.
+
+The index follows the Bosch scale: 0 is excellent, 500 is very bad air.
+It is an open approximation, not the output of the Bosch BSEC library.
+"""
+
+import math
+import time
+
+BASELINE_FILE = "iaq_baseline"
+# Saved baselines older than this are dropped, the sensor drifted while powered off
+BASELINE_MAX_AGE_S = 86400
+
+# Humidity the score is centred on, in %RH
+HUMIDITY_BASELINE = 40.0
+# Part of the score given to humidity, the rest is given to the gas resistance
+HUMIDITY_WEIGHT = 0.25
+# Empirical drop of the gas resistance per %RH above HUMIDITY_BASELINE
+HUMIDITY_COEFFICIENT = 0.035
+
+
+class IAQEstimator:
+    """Scores gas resistance samples against an incrementally tracked baseline.
+
+    :param path: The file the baseline is persisted to, None to disable it.
+    :param rise: EWMA weight of samples above the baseline, cleaner air is
+        followed quickly.
+    :param fall: EWMA weight of samples below the baseline, polluted air only
+        drags the baseline down slowly.
+    :param save_every: Number of updates between two baseline writes.
+    :param max_age_s: The maximum age of the saved baseline in seconds.
+    """
+
+    def __init__(
+        self,
+        path=BASELINE_FILE,
+        rise=0.1,
+        fall=0.001,
+        save_every=60,
+        max_age_s=BASELINE_MAX_AGE_S,
+    ):
+        self.path = path
+        self.rise = rise
+        self.fall = fall
+        self.save_every = save_every
+        self.max_age_s = max_age_s
+        self.baseline = self._load()
+        self.iaq = None
+        self._updates = 0
+
+    def __repr__(self):
+        return f"IAQEstimator(baseline={self.baseline}, iaq={self.iaq})"
+
+    def _load(self):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as baseline_file:
+                baseline, saved = baseline_file.readline().split()
+            baseline, age = float(baseline), time.time() - int(saved)
+        except (OSError, ValueError):
+            return None
+        # a negative age means the clock restarted with a power loss
+        if not 0 <= age <= self.max_age_s or baseline <= 0:
+            return None
+        return baseline
+
+    def save(self):
+        """Writes the baseline and the current time to flash."""
+        if self.path is None or self.baseline is None:
+            return
+        with open(self.path, "w") as baseline_file:
+            baseline_file.write(f"{self.baseline} {int(time.time())}\n")
+
+    @staticmethod
+    def compensate(gas_resistance, humidity):
+        """Returns the gas resistance corrected to HUMIDITY_BASELINE."""
+        return gas_resistance * math.exp(
+            HUMIDITY_COEFFICIENT * (humidity - HUMIDITY_BASELINE)
+        )
+
+    def update(self, gas_resistance, humidity):
+        """Adds a sample taken with a stable heater.
+
+        Parameters:
+            gas_resistance (float): The gas resistance in Ohms.
+            humidity (float): The relative humidity in %RH.
+
+        Returns:
+            int: The IAQ index, 0 (excellent) to 500 (very bad).
+        """
+        resistance = self.compensate(gas_resistance, humidity)
+        if self.baseline is None:
+            self.baseline = resistance
+        weight = self.rise if resistance > self.baseline else self.fall
+        self.baseline += weight * (resistance - self.baseline)
+
+        self._updates += 1
+        if self._updates % self.save_every == 0:
+            try:
+                self.save()
+            except OSError:
+                pass
+
+        gas_score = min(resistance / self.baseline, 1.0) * (1 - HUMIDITY_WEIGHT) * 100
+        if humidity > HUMIDITY_BASELINE:
+            humidity_score = (100 - humidity) / (100 - HUMIDITY_BASELINE)
+        else:
+            humidity_score = humidity / HUMIDITY_BASELINE
+        humidity_score = max(humidity_score, 0.0) * HUMIDITY_WEIGHT * 100
+
+        self.iaq = round((100 - gas_score - humidity_score) * 5)
+        return self.iaq
@@ -6,6 +6,7 @@ import machine
 import ucontextlib
 import ujson
 import urequests
+import constants
 from machine import Pin, reset, lightsleep
 
 from constants import (
@@ -20,7 +21,8 @@ from constants import (
     DFROBOT_MICS_SENSOR,
 )
 
-from i2c import I2CAdapter
+from home_air_monitor_ota import ota_check
+from i2c import DEFAULT_FREQUENCY, I2CAdapter, I2CArbiter
 from lib import logging
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
@@ -31,6 +33,10 @@ for handler in logging.getLogger().handlers:
 if TEMP_HUM_PRESS_SENSOR.upper() == "BME680":
     TEMP_HUM_PRESS_SENSOR = TEMP_HUM_PRESS_SENSOR.upper()
     import bme680
+    from iaq import IAQEstimator
+
+    # Optional, (temperature C, duration ms) steps cycled by the gas heater, the first one feeds the IAQ index
+    BME680_HEATER_PROFILE = getattr(constants, "BME680_HEATER_PROFILE", ((320, 150),))
 if TEMP_HUM_PRESS_SENSOR.upper() == "BME280":
     TEMP_HUM_PRESS_SENSOR = TEMP_HUM_PRESS_SENSOR.upper()
     from bme280 import BME280
@@ -38,9 +44,12 @@ if TEMP_HUM_PRESS_SENSOR.upper() == "BME280":
 if PARTICLE_SENSOR.upper() in ("SDS011", "SDS021"):
     PARTICLE_SENSOR = PARTICLE_SENSOR.upper()
     from sds011 import SDS011
+
+    # Optional, constants.py is device specific and not updated over the air
+    SDS011_WORKING_PERIOD = getattr(constants, "SDS011_WORKING_PERIOD", 0)
 if PARTICLE_SENSOR.upper() == "PMS7003":
     PARTICLE_SENSOR = PARTICLE_SENSOR.upper()
-    from pms7003 import PassivePms7003
+    from pms7003 import ActivePms7003
     from errors import UartError
 if PARTICLE_SENSOR.upper() == "PTQS1005":
     PARTICLE_SENSOR = PARTICLE_SENSOR.upper()
@@ -50,7 +59,20 @@ if PARTICLE_SENSOR.upper() == "PTQS1005":
 
 if TVOC_CO2_SENSOR.upper() == "CCS811":
     TVOC_CO2_SENSOR = TVOC_CO2_SENSOR.upper()
-    from ccs811 import CCS811
+    from ccs811 import CCS811, DRIVE_MODE_PERIOD_MS
+
+    # Optional, GPIO wired to the CCS811 nINT output
+    CCS811_INT_PIN = getattr(constants, "CCS811_INT_PIN", None)
+    # A result every 10 s, the light sleep wakes up once per result instead of ten times
+    CCS811_DRIVE_MODE = 2
+    # Optional, seconds between two CCS811 reads while light sleeping between loops
+    CCS811_POLL_INTERVAL = getattr(
+        constants,
+        "CCS811_POLL_INTERVAL",
+        DRIVE_MODE_PERIOD_MS[CCS811_DRIVE_MODE] // 1000,
+    )
+    # The longest wait for a result when none arrived since the previous loop
+    CCS811_WAIT_MS = 2000
 
 if SOUND_LEVEL_SENSOR.upper() == "PCB_ARTIST_SOUND_LEVEL":
     SOUND_LEVEL_SENSOR = SOUND_LEVEL_SENSOR.upper()
@@ -58,9 +80,7 @@ if SOUND_LEVEL_SENSOR.upper() == "PCB_ARTIST_SOUND_LEVEL":
 
 if DFROBOT_MICS_SENSOR.upper() == "MICS-4514":
     DFROBOT_MICS_SENSOR = DFROBOT_MICS_SENSOR.upper()
-    from dfrobot_mics import Mics
-
-    _MICS_ERROR = -1
+    from dfrobot_mics import Mics, MICS_READY
 
 LOOP_COUNTER = 0
 RANDOM_SLEEP_VALUE = random.randint(50, 59)  # seconds
@@ -71,15 +91,49 @@ HARD_RESET_VALUE = int(
 )  # The Board will be restarted once per 24 hours
 logging.info(f"Hard reset value {HARD_RESET_VALUE}")
 
+# Check for a new release once per hour
+OTA_CHECK_VALUE = int(3600 / RANDOM_SLEEP_VALUE)
+logging.info(f"OTA check value {OTA_CHECK_VALUE}")
+
+# Time spent awake before an SDS011 report is expected, the UART is stopped in lightsleep
+SDS011_REPORT_GUARD_MS = 5000
+# Milliseconds between two UART checks while waiting awake for an SDS011 report
+SDS011_REPORT_POLL_MS = 100
+sds_sensor = None
+# Configured once and reused, the driver caches its settings between measurements
+bme680_sensor = None
+bme680_heater = None
+iaq_estimator = None
+ccs811_sensor = None
+# Optional, the I2C bus frequency in Hz, 400000 has to be opted in as constants.py is not updated over the air
+I2C_FREQUENCY = getattr(constants, "I2C_FREQUENCY", DEFAULT_FREQUENCY)
+
+# Seconds between two MICS warm-up steps while light sleeping between loops
+MICS_TICK_INTERVAL = 10
+# Latest (temperature, humidity) from the temp/humid/pressure sensor, used for CCS811 compensation
+environment = None
+
+# The PTQS1005 fields sent to the API, see get_particle_measurements
+PTQS1005_FIELDS = (
+    "pm10_atm",
+    "pm25_atm",
+    "pm100_atm",
+    "tvoc",
+    "hcho",
+    "co2",
+    "temp",
+    "hum",
+)
+
 
 def sds_measurements():
     """Initiates measurements for particulate matter (PM) using the SDS011
     sensor.
 
     Functionality:
-        Wakes up the SDS011 sensor, performs measurements for PM2.5 and PM10 over a period,
-        then puts the sensor back to sleep. It attempts to read the sensor values 10 times
-        with a delay between each read to ensure accurate readings.
+        Wakes up the SDS011 sensor, queries 10 measurements one second apart and reduces them
+        to their median after rejecting outliers (median absolute deviation).
+        The sensor is always put back to sleep, even if an error occurs.
 
     Returns:
         dict: A dictionary containing the PM2.5 and PM10 values if both are non-zero.
@@ -89,13 +143,112 @@ def sds_measurements():
     try:
         sds.wake()
         time.sleep(10)
-        for _ in range(10):
-            sds.read()
-        if sds.pm25 != 0 and sds.pm10 != 0:
-            return {"pm25": sds.pm25, "pm10": sds.pm10}
-        sds.sleep()
+        particle_data = sds.sample(count=10, interval_ms=1000)
+        if particle_data:
+            logging.info(
+                f"SDS011 median of {particle_data['samples']} samples, "
+                f"spread pm25 {particle_data['pm25_spread']} pm10 {particle_data['pm10_spread']}"
+            )
+        if particle_data and particle_data["pm25"] != 0 and particle_data["pm10"] != 0:
+            return {"pm25": particle_data["pm25"], "pm10": particle_data["pm10"]}
     except OSError:
         return False
+    finally:
+        with ucontextlib.suppress(OSError):
+            sds.sleep()
+
+
+def sds_working_period_measurements(sds: SDS011):
+    """Collects the measurement the SDS011 reported on its own in working
+    period mode.
+
+    Parameters:
+        sds (SDS011): The sensor configured with configure_working_period.
+
+    Functionality:
+        Processes the reports received on the UART since the previous loop without waking the sensor
+        or waiting, the sensor runs its fan and reports once per working period.
+
+    Returns:
+        dict: A dictionary containing the PM2.5 and PM10 values if a non-zero report was received.
+        None: If no report arrived since the previous loop.
+    """
+    if sds.read_report() and sds.pm25 != 0 and sds.pm10 != 0:
+        return {"pm25": sds.pm25, "pm10": sds.pm10}
+
+
+def lightsleep_polling(duration_ms: int, ccs: CCS811 = None, mics: Mics = None):
+    """Light sleeps, waking up to read the CCS811 and to advance the MICS warm-up if needed.
+
+    Parameters:
+        duration_ms (int): The time to sleep.
+        ccs (CCS811): The sensor adding its results to a running average, if any.
+        mics (Mics): The sensor warming up, if any.
+
+    Functionality:
+        The sleep is split in slices of CCS811_POLL_INTERVAL seconds (MICS_TICK_INTERVAL without a CCS811),
+        after each slice the latest CCS811 result is added to the average reported by the next loop and
+        the MICS warm-up is ticked until the sensor is calibrated.
+
+    Returns:
+        None
+    """
+    if mics is not None and mics.state == MICS_READY:
+        mics = None
+    if ccs is None and mics is None:
+        lightsleep(duration_ms)
+        return
+    slice_ms = (MICS_TICK_INTERVAL if ccs is None else CCS811_POLL_INTERVAL) * 1000
+    while duration_ms > 0:
+        asleep_ms = min(duration_ms, slice_ms)
+        lightsleep(asleep_ms)
+        duration_ms -= asleep_ms
+        with ucontextlib.suppress(OSError):
+            if ccs is not None:
+                ccs.poll()
+            if mics is not None:
+                mics.tick()
+
+
+def sleep_until_next_loop(
+    duration_ms: int, sds: SDS011 = None, ccs: CCS811 = None, mics: Mics = None
+):
+    """Sleeps between loops, light sleeping whenever possible.
+
+    Parameters:
+        duration_ms (int): The time to sleep.
+        sds (SDS011): The sensor running in working period mode, if any.
+        ccs (CCS811): The sensor read while light sleeping, if any.
+        mics (Mics): The sensor warming up while light sleeping, if any.
+
+    Functionality:
+        Without an SDS011 in working period mode the board light sleeps for the whole duration.
+        Otherwise the UART has to stay powered when the sensor reports, so the board only light sleeps
+        until shortly before the next expected report and then polls the UART awake. The report is picked
+        up as soon as it arrives, which keeps the schedule of the next one accurate, and the rest of the
+        duration is light slept again. Until the first report has been received the board waits awake.
+
+    Returns:
+        None
+    """
+    until_report = sds.ms_until_report() if sds else None
+    if sds is None or (
+        until_report is not None
+        and until_report - SDS011_REPORT_GUARD_MS >= duration_ms
+    ):
+        lightsleep_polling(duration_ms, ccs=ccs, mics=mics)
+        return
+    deadline = time.ticks_add(time.ticks_ms(), duration_ms)
+    if until_report is not None and until_report > SDS011_REPORT_GUARD_MS:
+        lightsleep_polling(until_report - SDS011_REPORT_GUARD_MS, ccs=ccs, mics=mics)
+    remaining = time.ticks_diff(deadline, time.ticks_ms())
+    while remaining > 0:
+        if sds.poll_report():
+            # The next report is a whole working period away
+            lightsleep_polling(remaining, ccs=ccs, mics=mics)
+            return
+        time.sleep_ms(min(remaining, SDS011_REPORT_POLL_MS))
+        remaining = time.ticks_diff(deadline, time.ticks_ms())
 
 
 def pms7003_measurements():
@@ -105,7 +258,8 @@ def pms7003_measurements():
         None
 
     Functionality:
-        Wakes up the PMS7003 sensor, waits for it to stabilize, then reads particulate matter measurements.
+        Wakes up the PMS7003 sensor in active mode for 10 s, the time the passive mode waited for a single
+        frame, and returns the median of the frames it streams once the fan settled.
         In case of an error (OSError, UartError, TypeError), it returns an empty dictionary.
         It ensures the sensor is put back to sleep after the operation, even if an error occurs.
 
@@ -113,11 +267,12 @@ def pms7003_measurements():
         dict: A dictionary containing the particulate matter measurements if successful,
         or an empty dictionary if an error occurs.
     """
-    pms = PassivePms7003(uart=2)
+    pms = ActivePms7003(uart=2)
     try:
         pms.wakeup()
-        time.sleep(10)
-        return pms.read()
+        particle_data = pms.sample()
+        logging.info(f"PMS7003 median of {particle_data['SAMPLES']} frames")
+        return particle_data
     except (OSError, UartError, TypeError):
         return {}
     finally:
@@ -144,7 +299,7 @@ def ptqs1005_measurements() -> dict:
     try:
         ptqs1005_sensor.wakeup(reset_pin=23)
         time.sleep(10)
-        output_data = ptqs1005_sensor.measure()
+        output_data = ptqs1005_sensor.measure(fields=PTQS1005_FIELDS)
     except (OSError, UartError, TypeError):
         return output_data
     finally:
@@ -321,7 +476,8 @@ def get_particle_measurements(sensor_model: str) -> dict:
         The keys in the dictionary depend on the sensor model.
         For PMS7003, it includes 'pm1', 'pm25', and 'pm10'.
         For PTQS1005, it includes 'pm1', 'pm25', 'pm10', 'tvoc', 'hcho', 'co2', 'temperature', and 'humidity'.
-        For SDS011/SDS021, it includes 'pm25' and 'pm10'.
+        For SDS011/SDS021, it includes 'pm25' and 'pm10', in working period mode only when the sensor
+        reported since the previous loop.
         If the sensor model does not match any of the specified models or if no data could be retrieved,
         an empty dictionary is returned.
     """
@@ -348,7 +504,10 @@ def get_particle_measurements(sensor_model: str) -> dict:
                 "humidity": round(particle_data["hum"]),
             }
     if sensor_model in {"SDS011", "SDS021"}:
-        particle_data = sds_measurements()
+        if sds_sensor:
+            particle_data = sds_working_period_measurements(sds_sensor)
+        else:
+            particle_data = sds_measurements()
         with ucontextlib.suppress(TypeError):
             data = {
                 "pm25": round(particle_data["pm25"]),
@@ -365,34 +524,55 @@ def get_tvoc_co2(sensor_model: str):
         sensor_model (str): The model of the sensor to retrieve data from.
 
     Functionality:
-        Attempts to initialize the specified sensor model with the I2C adapter and address.
-        If the sensor's data is ready, it returns the eCO2 and tVOC readings.
+        Initializes the specified sensor model with the I2C adapter and address on first use and keeps it,
+        restoring the baseline saved in flash. The latest temperature and humidity are sent to the sensor
+        for compensation and the baseline is saved periodically once the sensor ran in.
+        Returns the average of the eCO2 and tVOC readings collected since the previous loop, waiting for
+        up to CCS811_WAIT_MS for the next reading if none arrived.
         Handles exceptions for OSError and RuntimeError by returning False.
 
     Returns:
         dict: A dictionary containing the "co2" and "tvoc" levels if successful.
         bool: False if an error occurs during sensor initialization or data retrieval.
     """
+    global ccs811_sensor
     if sensor_model == "CCS811":
         try:
-            sensor = CCS811(i2c=i2c_adapter, addr=90)
-            if sensor.data_ready():
-                return {"co2": sensor.eCO2, "tvoc": sensor.tVOC}
+            if ccs811_sensor is None:
+                ccs811_sensor = CCS811(
+                    i2c=i2c_adapter,
+                    addr=90,
+                    int_pin=CCS811_INT_PIN,
+                    mode=CCS811_DRIVE_MODE,
+                )
+                if ccs811_sensor.restore_baseline():
+                    logging.info("CCS811 baseline restored")
+            sensor = ccs811_sensor
+            if environment:
+                sensor.put_env_data(humidity=environment[1], temp=environment[0])
+            if sensor.persist_baseline():
+                logging.info("CCS811 baseline saved")
+            sensor.poll()
+            averages = sensor.average()
+            if averages is None and sensor.wait(timeout_ms=CCS811_WAIT_MS):
+                averages = sensor.average()
+            if averages:
+                return {"co2": averages[0], "tvoc": averages[1]}
         except (OSError, RuntimeError):
+            ccs811_sensor = None  # initialise the sensor again on the next loop
             return False
 
 
 def get_mics_gas_data(sensor_model: str, _dfrobot: Mics):
-    measured_gas_particles = ("CO", "CH4", "C2H5OH", "H2", "NH3", "NO2")
     data = {}
     if sensor_model == "MICS-4514":
         try:
-            for _ in measured_gas_particles:
-                gas_ppm = _dfrobot.get_gas_ppm(gas_type=_)
-                if gas_ppm == _MICS_ERROR:
-                    logging.error(f"Error reading {_} from MICS sensor")
-                    return None  # Return None to indicate an error
-                data[_.lower()] = int(gas_ppm)
+            gas_ppm = _dfrobot.get_all_gas_ppm()  # a single read for every gas
+            if gas_ppm is None:
+                logging.error("Error reading gases from MICS sensor")
+                return None  # Return None to indicate an error
+            for gas, ppm in gas_ppm.items():
+                data[gas.lower()] = int(ppm)
         except (OSError, RuntimeError):
             logging.error("Error reading from MICS sensor")
             return None  # Return None to indicate an error
@@ -415,42 +595,63 @@ def get_temp_humid_pressure_measurements(
         provided I2C adapter.
         For the BME280 sensor, it fetches temperature, humidity, and pressure readings.
         For the BME680 sensor, it additionally fetches gas resistance along with temperature, humidity,
-        and pressure readings.
+        and pressure readings. The BME680 is initialised on first use and kept between loops.
         It logs the readings for the BME280 sensor. In case of an error (OSError, RuntimeError), it returns False.
 
     Returns:
         dict: A dictionary containing the sensor readings if successful.
-        The keys are "temperature", "humidity", "pressure", and optionally "gas_resistance" for the BME680 sensor.
+        The keys are "temperature", "humidity", "pressure", and optionally "gas_resistance" and "iaq"
+        (0 excellent - 500 very bad, once the heater is stable) for the BME680 sensor.
         bool: False if there is an error initializing the sensor or fetching the data.
     """
+    global bme680_sensor, bme680_heater, iaq_estimator, environment
     if sensor_model == "BME280":
         try:
             bme = BME280(i2c=i2c_adapter)
-            if bme.values:
-                logging.info(f"BME280 readings {bme.values}")
+            readings = bme.values  # every access triggers a measurement
+            if readings:
+                logging.info(f"BME280 readings {readings}")
+                environment = (readings["temperature"], readings["humidity"])
                 return {
-                    "temperature": bme.values["temperature"],
-                    "humidity": bme.values["humidity"],
-                    "pressure": bme.values["pressure"],
+                    "temperature": readings["temperature"],
+                    "humidity": readings["humidity"],
+                    "pressure": readings["pressure"],
                 }
         except (OSError, RuntimeError):
             return False
 
     elif sensor_model == "BME680":
         try:
-            sensor = bme680.BME680(i2c_device=i2c_adapter)
-            sensor.set_humidity_oversample(bme680.OS_2X)
-            sensor.set_pressure_oversample(bme680.OS_4X)
-            sensor.set_temperature_oversample(bme680.OS_8X)
-            sensor.set_filter(bme680.FILTER_SIZE_3)
+            if bme680_sensor is None:
+                bme680_sensor = bme680.BME680(i2c_device=i2c_adapter)
+                bme680_sensor.set_humidity_oversample(bme680.OS_2X)
+                bme680_sensor.set_pressure_oversample(bme680.OS_4X)
+                bme680_sensor.set_temperature_oversample(bme680.OS_8X)
+                bme680_sensor.set_filter(bme680.FILTER_SIZE_3)
+                bme680_heater = bme680.HeaterProfileSequencer(
+                    bme680_sensor, steps=BME680_HEATER_PROFILE
+                )
+            if iaq_estimator is None:
+                iaq_estimator = IAQEstimator()
+            sensor = bme680_sensor
+            bme680_heater.advance()
             if sensor.get_sensor_data():
-                return {
+                environment = (sensor.data.temperature, sensor.data.humidity)
+                values = {
                     "temperature": sensor.data.temperature,
                     "humidity": sensor.data.humidity,
                     "pressure": sensor.data.pressure,
                     "gas_resistance": sensor.data.gas_resistance,
                 }
+                if sensor.data.gas_index == 0 and sensor.data.heat_stable:
+                    iaq_estimator.update(
+                        sensor.data.gas_resistance, sensor.data.humidity
+                    )
+                if iaq_estimator.iaq is not None:
+                    values["iaq"] = iaq_estimator.iaq
+                return values
         except (OSError, RuntimeError):
+            bme680_sensor = None  # initialise the sensor again on the next loop
             return False
 
     else:
@@ -484,29 +685,34 @@ def augment_data(measurements: dict, sensor_model: str):
 
 
 if __name__ == "__main__":
-    i2c_adapter = I2CAdapter(scl=Pin(22), sda=Pin(21), freq=100000)
+    # All I2C sensors share the bus on pins 21/22, the arbiter keeps their transactions apart
+    i2c_adapter = I2CArbiter(I2CAdapter(scl=Pin(22), sda=Pin(21), freq=I2C_FREQUENCY))
+    logging.info(f"Using {i2c_adapter}")
 
+    dfrobot = None
     if DFROBOT_MICS_SENSOR:
-        mics_sensor_available = False
         logging.info(f"Warming up DFRobot sensor: {DFROBOT_MICS_SENSOR}")
         dfrobot = Mics(i2c_adapter)
-        dfrobot.wakeup_mode()
-        dfrobot.get_power_mode()
         try:
-            dfrobot.warm_up_time()
-            time.sleep(5)
-            if (
-                get_mics_gas_data(sensor_model=DFROBOT_MICS_SENSOR, _dfrobot=dfrobot)
-                is None
-            ):
-                logging.error("Failed to initialize MICS sensor. Rebooting...")
-                reset()
-            mics_sensor_available = True
-            time.sleep(5)
+            mics_awake = dfrobot.is_awake()
+            dfrobot.wakeup_mode()
         except OSError:
             reset()
-        finally:
-            pass
+        if mics_awake and dfrobot.restore_baseline():
+            logging.info("MICS sensor kept running, using its saved baseline")
+        else:
+            # Ticked from the loop, the other sensors report while the MICS sensor warms up
+            dfrobot.start_warm_up()
+
+    if PARTICLE_SENSOR in ("SDS011", "SDS021"):
+        logging.info(
+            f"{PARTICLE_SENSOR} working period {SDS011_WORKING_PERIOD} minutes"
+        )
+        sds = SDS011(uart=2)
+        # Also clears a period left in the sensor flash when switching back to query mode
+        sds.configure_working_period(SDS011_WORKING_PERIOD)
+        if SDS011_WORKING_PERIOD:
+            sds_sensor = sds
 
     while True:
         try:
@@ -537,7 +743,7 @@ if __name__ == "__main__":
                 del values
                 time.sleep(1)
 
-            if DFROBOT_MICS_SENSOR and mics_sensor_available:
+            if DFROBOT_MICS_SENSOR and dfrobot.tick():
                 logging.info(f"Using DFRobot MICS sensor {DFROBOT_MICS_SENSOR}")
                 mics_data = get_mics_gas_data(
                     sensor_model=DFROBOT_MICS_SENSOR, _dfrobot=dfrobot
@@ -584,12 +790,23 @@ if __name__ == "__main__":
 
             LOOP_COUNTER += 1
             logging.info(f"Increasing loop_counter, actual value {LOOP_COUNTER}")
+            logging.info(f"I2C bus usage {i2c_adapter.stats()}")
             if LOOP_COUNTER == HARD_RESET_VALUE:
                 logging.info(f"Resetting device, loop counter {LOOP_COUNTER}")
+                if DFROBOT_MICS_SENSOR and dfrobot.state == MICS_READY:
+                    # The heater keeps running through the reset, the fresh baseline skips the next warm-up
+                    dfrobot.save_baseline()
                 reset()
+            if LOOP_COUNTER % OTA_CHECK_VALUE == 0:
+                ota_check()
             if not SOUND_LEVEL_SENSOR:
                 logging.info(f"Sleeping for {RANDOM_SLEEP_VALUE} seconds")
-                lightsleep(RANDOM_SLEEP_VALUE * 1000)
+                sleep_until_next_loop(
+                    RANDOM_SLEEP_VALUE * 1000,
+                    sds=sds_sensor,
+                    ccs=ccs811_sensor,
+                    mics=dfrobot,
+                )
 
         except Exception as error:
             logging.info(f"Caught exception {error}")
@@ -1,28 +1,126 @@
 import machine
+import time
 import ubinascii
+import uhashlib
 import uos
 import urequests
 
+try:
+    import deflate
+except ImportError:
+    deflate = None
 
-def check_version(host, project, auth=None, timeout=5) -> (bool, str):
+CHUNK_SIZE = 1024
+COMPRESSED_SUFFIX = '.z'
+MANIFEST_NAME = 'manifest.json'
+JOURNAL_FILE = 'tmp/journal'
+
+
+VERSION_CACHE_FILE = 'version_cache'
+# The last version whose install failed at boot, and when
+FAILED_UPDATE_FILE = 'ota_failed'
+# Seconds before a failed version resets the device for another attempt
+FAILED_UPDATE_RETRY_AFTER = 6 * 3600
+
+_pending_version_cache = None
+
+
+def load_version_cache() -> (str, str):
+    try:
+        with open(VERSION_CACHE_FILE, 'r') as version_cache_file:
+            etag = version_cache_file.readline().strip()
+            last_modified = version_cache_file.readline().strip()
+        return etag, last_modified
+    except OSError:
+        return '', ''
+
+
+def save_version_cache(etag, last_modified) -> None:
+    if not etag and not last_modified:
+        return
+    try:
+        with open(VERSION_CACHE_FILE, 'w') as version_cache_file:
+            version_cache_file.write(f'{etag}\n{last_modified}\n')
+    except OSError as ex:
+        print(f'Unable to store version cache: {ex}')
+
+
+def clear_version_cache() -> None:
+    try:
+        uos.remove(VERSION_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def load_failed_update() -> (str, int):
+    try:
+        with open(FAILED_UPDATE_FILE, 'r') as failed_update_file:
+            return failed_update_file.readline().strip(), int(failed_update_file.readline())
+    except (OSError, ValueError):
+        return '', 0
+
+
+def record_failed_update(remote_version) -> None:
+    try:
+        with open(FAILED_UPDATE_FILE, 'w') as failed_update_file:
+            failed_update_file.write(f'{remote_version}\n{int(time.time())}\n')
+    except OSError as ex:
+        print(f'Unable to record failed update: {ex}')
+
+
+def clear_failed_update() -> None:
+    try:
+        uos.remove(FAILED_UPDATE_FILE)
+    except OSError:
+        pass
+
+
+def get_response_header(response, name) -> str:
+    headers = getattr(response, 'headers', None) or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value.strip()
+    return ''
+
+
+def check_version(host, project, auth=None, timeout=5, conditional=True) -> (bool, str):
+    global _pending_version_cache
     current_version = ''
+    _pending_version_cache = None
     try:
         if 'version' in uos.listdir():
             with open('version', 'r') as current_version_file:
                 current_version = current_version_file.readline().strip()
 
+        headers = {}
         if auth:
-            response = urequests.get(f'{host}/{project}/version', headers={'Authorization': f'Basic {auth}'}, timeout=timeout)
-        else:
-            response = urequests.get(f'{host}/{project}/version', timeout=timeout)
+            headers['Authorization'] = f'Basic {auth}'
+        if conditional and current_version:
+            etag, last_modified = load_version_cache()
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = urequests.get(f'{host}/{project}/version', headers=headers, timeout=timeout)
         response_status_code = response.status_code
+        if response_status_code == 304:
+            response.close()
+            return False, current_version
         response_text = response.text
+        etag = get_response_header(response, 'ETag')
+        last_modified = get_response_header(response, 'Last-Modified')
         response.close()
         if response_status_code != 200:
             print(f'Remote version file {host}/{project}/version not found')
             return False, current_version
         remote_version = response_text.strip()
-        return current_version != remote_version, remote_version
+        if current_version == remote_version:
+            save_version_cache(etag, last_modified)
+            return False, remote_version
+        # Validators are only stored once the new version is installed, otherwise a failed update would be masked by 304
+        _pending_version_cache = (etag, last_modified)
+        return True, remote_version
     except Exception as ex:
         print(f'Something went wrong: {ex}')
         return False, current_version
@@ -37,6 +135,126 @@ def generate_auth(user=None, passwd=None) -> str | None:
     return auth_bytes.decode().strip()
 
 
+def get(url, auth=None, timeout=5, headers=None):
+    headers = headers or {}
+    if auth:
+        headers['Authorization'] = f'Basic {auth}'
+    return urequests.get(url, headers=headers, timeout=timeout)
+
+
+def fetch_manifest(url, auth=None, timeout=5) -> dict | None:
+    try:
+        response = get(url, auth=auth, timeout=timeout)
+        try:
+            if response.status_code != 200:
+                print(f'Remote manifest {url} not found, skipping hash verification')
+                return {}
+            return response.json().get('files', {})
+        finally:
+            response.close()
+    except Exception as ex:
+        print(f'Unable to read remote manifest {url}: {ex}')
+        return None
+
+
+def file_size(path) -> int:
+    try:
+        return uos.stat(path)[6]
+    except OSError:
+        return 0
+
+
+def remove_file(path) -> None:
+    try:
+        uos.remove(path)
+    except OSError:
+        pass
+
+
+def hash_file(path, digest, buffer) -> None:
+    view = memoryview(buffer)
+    with open(path, 'rb') as source_file:
+        while True:
+            length = source_file.readinto(buffer)
+            if not length:
+                break
+            digest.update(view[:length])
+
+
+def download_file(url, path, auth=None, timeout=5, compressed=False, offset=0) -> str | None:
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+    response = get(url, auth=auth, timeout=timeout, headers=headers)
+    try:
+        digest = uhashlib.sha256()
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        if offset and response.status_code == 416:
+            # The previous attempt already received the whole file
+            hash_file(path, digest, buffer)
+            return ubinascii.hexlify(digest.digest()).decode()
+        if response.status_code == 206:
+            hash_file(path, digest, buffer)
+            mode = 'ab'
+        elif response.status_code == 200:
+            mode = 'wb'
+        else:
+            return None
+        content_length = get_response_header(response, 'Content-Length')
+        received = 0
+        stream = response.raw
+        if compressed:
+            stream = deflate.DeflateIO(stream, deflate.ZLIB)
+        with open(path, mode) as target_file:
+            while True:
+                length = stream.readinto(buffer)
+                if not length:
+                    break
+                target_file.write(view[:length])
+                digest.update(view[:length])
+                received += length
+        if not compressed and content_length and received != int(content_length):
+            raise OSError(f'Incomplete download, received {received} of {content_length} bytes')
+        return ubinascii.hexlify(digest.digest()).decode()
+    finally:
+        response.close()
+
+
+def load_journal(remote_version) -> (dict, list):
+    # The journal keeps finished files (with their hash) and plain downloads that may be resumed
+    completed = {}
+    resumable = []
+    try:
+        with open(JOURNAL_FILE, 'r') as journal_file:
+            if journal_file.readline().strip() != remote_version:
+                raise ValueError('Journal belongs to another version')
+            for line in journal_file:
+                entry = line.split()
+                if len(entry) == 3 and entry[0] == 'done':
+                    completed[entry[1]] = entry[2]
+                elif len(entry) == 2 and entry[0] == 'part':
+                    resumable.append(entry[1])
+    except (OSError, ValueError):
+        clear_tmp()
+        uos.mkdir('tmp')
+        with open(JOURNAL_FILE, 'w') as journal_file:
+            journal_file.write(f'{remote_version}\n')
+    return completed, resumable
+
+
+def append_journal(*entry) -> None:
+    with open(JOURNAL_FILE, 'a') as journal_file:
+        journal_file.write(' '.join(entry) + '\n')
+
+
+def clear_tmp() -> None:
+    try:
+        for filename in uos.listdir('tmp'):
+            uos.remove(f'tmp/{filename}')
+        uos.rmdir('tmp')
+    except OSError:
+        pass
+
+
 def ota_update(
         host,
         project,
@@ -46,57 +264,109 @@ def ota_update(
         passwd=None,
         hard_reset_device=True,
         soft_reset_device=False,
-        timeout=5
+        timeout=5,
+        compressed=False,
+        verify_hashes=False
 ) -> None:
     all_files_found = True
     auth = generate_auth(user, passwd)
     prefix_or_path_separator = '_' if use_version_prefix else '/'
+    compressed = compressed and deflate is not None
+    remote_version = None
     try:
         version_changed, remote_version = check_version(host, project, auth=auth, timeout=timeout)
         if version_changed:
-            try:
-                uos.mkdir('tmp')
-            except Exception:
-                pass
+            completed, resumable = load_journal(remote_version)
+            manifest = {}
+            if verify_hashes:
+                manifest = fetch_manifest(f'{host}/{project}/{remote_version}{prefix_or_path_separator}{MANIFEST_NAME}', auth=auth, timeout=timeout)
+                if manifest is None:
+                    record_failed_update(remote_version)
+                    return
             for filename in filenames:
-                if auth:
-                    response = urequests.get(f'{host}/{project}/{remote_version}{prefix_or_path_separator}{filename}', headers={'Authorization': f'Basic {auth}'}, timeout=timeout)
-                else:
-                    response = urequests.get(f'{host}/{project}/{remote_version}{prefix_or_path_separator}{filename}', timeout=timeout)
-                response_status_code = response.status_code
-                response_text = response.text
-                response.close()
-                if response_status_code != 200:
-                    print(f'Remote source file {host}/{project}/{remote_version}{prefix_or_path_separator}{filename} not found')
+                url = f'{host}/{project}/{remote_version}{prefix_or_path_separator}{filename}'
+                expected_digest = manifest.get(filename, {}).get('sha256')
+                digest = completed.get(filename)
+                if digest and file_size(f'tmp/{filename}') and (not expected_digest or expected_digest == digest):
+                    continue
+                # Only plain downloads can be resumed, an interrupted inflate falls back to a plain download
+                offset = file_size(f'tmp/{filename}') if filename in resumable else 0
+                # A truncated deflate stream is only detected by the manifest hash
+                use_compression = compressed and expected_digest and filename not in resumable
+                digest = None
+                try:
+                    if use_compression:
+                        # Plain files are used when the release was published without compressed variants
+                        digest = download_file(url + COMPRESSED_SUFFIX, f'tmp/{filename}', auth=auth, timeout=timeout, compressed=True)
+                    if digest is None:
+                        if filename not in resumable:
+                            append_journal('part', filename)
+                            resumable.append(filename)
+                        digest = download_file(url, f'tmp/{filename}', auth=auth, timeout=timeout, offset=offset)
+                except OSError as ex:
+                    # The partial file is kept and resumed on the next attempt
+                    print(f'Download of {url} interrupted: {ex}')
+                    all_files_found = False
+                    if filename not in resumable:
+                        append_journal('part', filename)
+                        remove_file(f'tmp/{filename}')
+                    continue
+                if digest is None:
+                    print(f'Remote source file {url} not found')
+                    all_files_found = False
+                    continue
+                if expected_digest and expected_digest != digest:
+                    print(f'Remote source file {url} hash mismatch')
+                    if filename not in resumable:
+                        append_journal('part', filename)
+                    remove_file(f'tmp/{filename}')
                     all_files_found = False
                     continue
-                with open(f'tmp/{filename}', 'w') as source_file:
-                    source_file.write(response_text)
+                append_journal('done', filename, digest)
             if all_files_found:
                 for filename in filenames:
-                    with open(f'tmp/{filename}', 'r') as source_file, open(filename, 'w') as target_file:
-                        target_file.write(source_file.read())
-                    uos.remove(f'tmp/{filename}')
-                try:
-                    uos.rmdir('tmp')
-                except Exception:
-                    pass
+                    remove_file(filename)
+                    uos.rename(f'tmp/{filename}', filename)
+                clear_tmp()
                 with open('version', 'w') as current_version_file:
                     current_version_file.write(remote_version)
+                clear_failed_update()
+                if _pending_version_cache:
+                    save_version_cache(*_pending_version_cache)
+                else:
+                    clear_version_cache()
                 if soft_reset_device:
                     print('Soft-resetting device...')
                     machine.soft_reset()
                 if hard_reset_device:
                     print('Hard-resetting device...')
                     machine.reset()
+            else:
+                record_failed_update(remote_version)
     except Exception as ex:
         print(f'Something went wrong: {ex}')
+        if remote_version:
+            record_failed_update(remote_version)
 
 
-def check_for_ota_update(host, project, user=None, passwd=None, timeout=5, soft_reset_device=False):
+def check_for_ota_update(
+        host,
+        project,
+        user=None,
+        passwd=None,
+        timeout=5,
+        soft_reset_device=False,
+        retry_after=FAILED_UPDATE_RETRY_AFTER
+) -> None:
     auth = generate_auth(user, passwd)
     version_changed, remote_version = check_version(host, project, auth=auth, timeout=timeout)
     if version_changed:
+        # A version that failed to install at boot only resets the device again once retry_after expired,
+        # the failure is recorded during this uptime so the clock does not need to be set
+        failed_version, failed_at = load_failed_update()
+        if failed_version == remote_version and 0 <= time.time() - failed_at < retry_after:
+            print(f'Found new version {remote_version}, its install failed, retrying in {retry_after - int(time.time() - failed_at)} s')
+            return
         if soft_reset_device:
             print(f'Found new version {remote_version}, soft-resetting device...')
             machine.soft_reset()
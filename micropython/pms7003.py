@@ -1,7 +1,11 @@
 import machine
 import struct
 import time
+from array import array
+
+from aggregation import median
 from errors import UartError
+from uart_frame import FrameSync
 
 
 class Pms7003:
@@ -25,20 +29,30 @@ class Pms7003:
     PMS_ERROR = 14
     PMS_CHECKSUM = 15
 
+    PMS_FRAME_SIZE = 32
+    PMS_CHECKSUM_OFFSET = 30
+    PMS_WORDS = 13
+    PMS_VALUES = 16
+
+    READ_TIMEOUT_MS = 3000
+
     def __init__(self, uart):
         self.uart = machine.UART(
             uart, baudrate=9600, bits=8, parity=None, stop=1
         )
+        self.frame_sync = FrameSync(
+            self.uart,
+            header=bytes([Pms7003.START_BYTE_1, Pms7003.START_BYTE_2]),
+            frame_length=Pms7003.PMS_FRAME_SIZE,
+            checksum=self._valid_checksum,
+        )
+        # the checksummed head of the frame buffer, sliced once
+        checksum_offset = Pms7003.PMS_CHECKSUM_OFFSET
+        self._checksummed = memoryview(self.frame_sync.frame)[:checksum_offset]
 
     def __repr__(self):
         return f"Pms7003({self.uart})"
 
-    @staticmethod
-    def _assert_byte(byte, expected):
-        if byte is None or len(byte) < 1 or ord(byte) != expected:
-            return False
-        return True
-
     @staticmethod
     def _format_bytearray(buffer):
         return "".join("0x{:02x} ".format(i) for i in buffer)
@@ -59,49 +73,59 @@ class Pms7003:
                     f"Wrong UART response, expecting: {Pms7003._format_bytearray(response)}, getting: {Pms7003._format_bytearray(buffer)}"
                 )
 
-    def read(self):
+    def _valid_checksum(self, frame):
+        """Checks the frame in the frame_sync buffer, without slicing it."""
+        checksum_offset = Pms7003.PMS_CHECKSUM_OFFSET
+        checksum = (frame[checksum_offset] << 8) | frame[checksum_offset + 1]
+        return sum(self._checksummed) == checksum
 
-        while True:
-
-            first_byte = self.uart.read(1)
-            if not self._assert_byte(first_byte, Pms7003.START_BYTE_1):
-                continue
+    def _read_frame(self, timeout_ms=READ_TIMEOUT_MS):
+        frame = self.frame_sync.read(timeout_ms)
+        if frame is None:
+            raise UartError(
+                f"No valid frame within {timeout_ms} ms, {self.frame_sync}"
+            )
+        return frame
 
-            second_byte = self.uart.read(1)
-            if not self._assert_byte(second_byte, Pms7003.START_BYTE_2):
-                continue
+    @staticmethod
+    def _decode_into(frame, values):
+        for index in range(Pms7003.PMS_WORDS):
+            values[index] = (frame[2 + 2 * index] << 8) | frame[3 + 2 * index]
+        values[Pms7003.PMS_VERSION] = frame[28]
+        values[Pms7003.PMS_ERROR] = frame[29]
+        values[Pms7003.PMS_CHECKSUM] = (frame[30] << 8) | frame[31]
 
-            # we are reading 30 bytes left
-            read_bytes = self.uart.read(30)
-            if len(read_bytes) < 30:
-                continue
+    def read(self):
 
-            data = struct.unpack("!HHHHHHHHHHHHHBBH", read_bytes)
+        data = struct.unpack_from("!HHHHHHHHHHHHHBBH", self._read_frame(), 2)
 
-            checksum = Pms7003.START_BYTE_1 + Pms7003.START_BYTE_2
-            checksum += sum(read_bytes[:28])
+        return {
+            "FRAME_LENGTH": data[Pms7003.PMS_FRAME_LENGTH],
+            "PM1_0": data[Pms7003.PMS_PM1_0],
+            "PM2_5": data[Pms7003.PMS_PM2_5],
+            "PM10_0": data[Pms7003.PMS_PM10_0],
+            "PM1_0_ATM": data[Pms7003.PMS_PM1_0_ATM],
+            "PM2_5_ATM": data[Pms7003.PMS_PM2_5_ATM],
+            "PM10_0_ATM": data[Pms7003.PMS_PM10_0_ATM],
+            "PCNT_0_3": data[Pms7003.PMS_PCNT_0_3],
+            "PCNT_0_5": data[Pms7003.PMS_PCNT_0_5],
+            "PCNT_1_0": data[Pms7003.PMS_PCNT_1_0],
+            "PCNT_2_5": data[Pms7003.PMS_PCNT_2_5],
+            "PCNT_5_0": data[Pms7003.PMS_PCNT_5_0],
+            "PCNT_10_0": data[Pms7003.PMS_PCNT_10_0],
+            "VERSION": data[Pms7003.PMS_VERSION],
+            "ERROR": data[Pms7003.PMS_ERROR],
+            "CHECKSUM": data[Pms7003.PMS_CHECKSUM],
+        }
 
-            if checksum != data[Pms7003.PMS_CHECKSUM]:
-                continue
+    def read_into(self, values):
+        """Reads a frame into values without allocating.
 
-            return {
-                "FRAME_LENGTH": data[Pms7003.PMS_FRAME_LENGTH],
-                "PM1_0": data[Pms7003.PMS_PM1_0],
-                "PM2_5": data[Pms7003.PMS_PM2_5],
-                "PM10_0": data[Pms7003.PMS_PM10_0],
-                "PM1_0_ATM": data[Pms7003.PMS_PM1_0_ATM],
-                "PM2_5_ATM": data[Pms7003.PMS_PM2_5_ATM],
-                "PM10_0_ATM": data[Pms7003.PMS_PM10_0_ATM],
-                "PCNT_0_3": data[Pms7003.PMS_PCNT_0_3],
-                "PCNT_0_5": data[Pms7003.PMS_PCNT_0_5],
-                "PCNT_1_0": data[Pms7003.PMS_PCNT_1_0],
-                "PCNT_2_5": data[Pms7003.PMS_PCNT_2_5],
-                "PCNT_5_0": data[Pms7003.PMS_PCNT_5_0],
-                "PCNT_10_0": data[Pms7003.PMS_PCNT_10_0],
-                "VERSION": data[Pms7003.PMS_VERSION],
-                "ERROR": data[Pms7003.PMS_ERROR],
-                "CHECKSUM": data[Pms7003.PMS_CHECKSUM],
-            }
+        values: array('H') (or alike) of at least PMS_VALUES items, indexed
+        with the PMS_* constants.
+        """
+        self._decode_into(self._read_frame(), values)
+        return values
 
 
 class PassivePms7003(Pms7003):
@@ -205,3 +229,100 @@ class PassivePms7003(Pms7003):
             request=PassivePms7003.READ_IN_PASSIVE_REQUEST, response=None
         )
         return super().read()
+
+    def read_into(self, values):
+        self._send_cmd(
+            request=PassivePms7003.READ_IN_PASSIVE_REQUEST, response=None
+        )
+        return super().read_into(values)
+
+
+class ActivePms7003(Pms7003):
+    """
+    Active mode streams a frame every 200-2300 ms. All frames received
+    during the sampling window are decoded into preallocated buffers and
+    reduced to their median, so one wake-up yields a robust reading
+    instead of a single noisy sample.
+    """
+
+    ENTER_ACTIVE_MODE_REQUEST = bytearray(
+        [
+            Pms7003.START_BYTE_1,
+            Pms7003.START_BYTE_2,
+            0xE1,
+            0x00,
+            0x01,
+            0x01,
+            0x71,
+        ]
+    )
+    # room for a few frames while the application is busy
+    RX_BUFFER_SIZE = 256
+    # fan-on time per sample, the 10 s the passive mode waited for its single frame
+    WAKE_WINDOW_MS = 10000
+    # fan spin-up, the frames of the remaining 4 s go into the median
+    SETTLE_MS = 6000
+
+    def __init__(self, uart, max_frames=32):
+        super().__init__(uart=uart)
+        self.uart.init(
+            baudrate=9600, bits=8, parity=None, stop=1, rxbuf=self.RX_BUFFER_SIZE
+        )
+        # the response is interleaved with data frames, it is not checked
+        self._send_cmd(
+            request=ActivePms7003.ENTER_ACTIVE_MODE_REQUEST, response=None
+        )
+        self._max_frames = max_frames
+        self._values = array("H", [0] * Pms7003.PMS_VALUES)
+        self._pm1 = array("H", [0] * max_frames)
+        self._pm25 = array("H", [0] * max_frames)
+        self._pm10 = array("H", [0] * max_frames)
+
+    def sleep(self):
+        self.frame_sync.flush()
+        self._send_cmd(request=PassivePms7003.SLEEP_REQUEST, response=None)
+
+    def wakeup(self):
+        self._send_cmd(request=PassivePms7003.WAKEUP_REQUEST, response=None)
+
+    def sample(self, duration_ms=WAKE_WINDOW_MS, settle_ms=SETTLE_MS):
+        """Collects frames for duration_ms and returns their median.
+
+        Frames received during the first settle_ms are discarded, the fan
+        needs them to spin up and flush the chamber. The defaults keep the fan
+        on as long as the passive mode did and leave a 4 s window, 1 to 20
+        frames depending on the concentration.
+
+        Returns:
+            dict: PM1_0_ATM, PM2_5_ATM and PM10_0_ATM medians and the number
+            of frames used in SAMPLES.
+        """
+        values = self._values
+        count = 0
+        start = time.ticks_ms()
+
+        while True:
+            remaining = duration_ms - time.ticks_diff(time.ticks_ms(), start)
+            if remaining <= 0:
+                break
+            frame = self.frame_sync.read(remaining)
+            if frame is None:
+                break
+            if time.ticks_diff(time.ticks_ms(), start) < settle_ms:
+                continue
+            if count < self._max_frames:
+                self._decode_into(frame, values)
+                self._pm1[count] = values[Pms7003.PMS_PM1_0_ATM]
+                self._pm25[count] = values[Pms7003.PMS_PM2_5_ATM]
+                self._pm10[count] = values[Pms7003.PMS_PM10_0_ATM]
+                count += 1
+
+        if not count:
+            raise UartError(f"No PMS7003 frames received, {self.frame_sync}")
+
+        return {
+            "PM1_0_ATM": median(self._pm1, count),
+            "PM2_5_ATM": median(self._pm25, count),
+            "PM10_0_ATM": median(self._pm10, count),
+            "SAMPLES": count,
+        }
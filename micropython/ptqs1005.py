@@ -1,14 +1,37 @@
-import time
-
 import machine
+import ustruct as struct
 import utime
 
-
-class Utility:
-    @staticmethod
-    def make_16bit_int(high, low) -> int:
-        """Combine two 8-bit integers into a 16-bit integer."""
-        return int(high) << 8 | int(low)
+from errors import UartError
+from uart_frame import FrameSync
+
+
+# Frame layout after the 4 byte header, all values big endian:
+# 12 x uint16 particle data, TVOC, TVOC quantity, HCHO, HCHO quantity, CO2, temperature, humidity
+_RESPONSE_FORMAT = ">12HHBHBHHH"
+_RESPONSE_FIELDS = (
+    "pm10",  # PM1
+    "pm25",  # PM2.5
+    "pm100",  # PM10
+    "pm10_atm",  # PM1 (atmosphere)
+    "pm25_atm",  # PM2.5 (atmosphere)
+    "pm100_atm",  # PM10 (atmosphere)
+    "part03",  # 0.3um particles
+    "part05",  # 0.5um particles
+    "part10",  # 1.0um particles
+    "part25",  # 2.5um particles
+    "part50",  # 5.0um particles
+    "part100",  # 10.0um particles
+    "tvoc",
+    "tvoc_quan",  # TVOC quantity
+    "hcho",
+    "hcho_quan",  # HCHO quantity
+    "co2",
+    "temp",
+    "hum",
+)
+_RESPONSE_INDEX = {name: index for index, name in enumerate(_RESPONSE_FIELDS)}
+_RESPONSE_SCALE = {"tvoc": 100.0, "hcho": 100.0, "temp": 10.0, "hum": 10.0}
 
 
 class ResponseValidator:
@@ -23,8 +46,8 @@ class ResponseValidator:
     @staticmethod
     def is_valid_checksum(raw_resp: bytes):
         """Check if the response checksum is valid."""
-        calculated_checksum = sum(raw_resp[:40]) & 0xFFFF
-        received_checksum = Utility.make_16bit_int(raw_resp[40], raw_resp[41])
+        calculated_checksum = sum(memoryview(raw_resp)[:40]) & 0xFFFF
+        (received_checksum,) = struct.unpack_from(">H", raw_resp, 40)
         return calculated_checksum == received_checksum
 
 
@@ -32,46 +55,40 @@ class ResponseParser:
     """ResponseParser class for parsing response data."""
 
     @staticmethod
-    def parse(raw_response: bytes) -> dict:
-        """Parse raw response bytes into a dictionary of sensor data."""
-        return ResponseParser.__parse_response(raw_response)
+    def parse(raw_response: bytes, fields: tuple = None) -> dict:
+        """Parse raw response bytes into a dictionary of sensor data.
 
-    @staticmethod
-    def __parse_response(raw_resp: bytes) -> dict:
-        """Parse the raw response bytes into a dictionary of sensor data."""
-        if not ResponseValidator.is_valid_header(raw_resp) or not ResponseValidator.is_valid_checksum(raw_resp):
-            raise Exception("Invalid response")
+        Only the requested fields are put in the dictionary, all of them when fields is None.
+        """
+        if not ResponseValidator.is_valid_header(raw_response) or not ResponseValidator.is_valid_checksum(
+            raw_response
+        ):
+            raise UartError("Invalid response")
 
+        values = struct.unpack_from(_RESPONSE_FORMAT, raw_response, 4)
         parsed_data = {}
-        parsed_data["pm10"] = Utility.make_16bit_int(raw_resp[4], raw_resp[5])  # PM1
-        parsed_data["pm25"] = Utility.make_16bit_int(raw_resp[6], raw_resp[7])  # PM2.5
-        parsed_data["pm100"] = Utility.make_16bit_int(raw_resp[8], raw_resp[9])  # PM10
-        parsed_data["pm10_atm"] = Utility.make_16bit_int(raw_resp[10], raw_resp[11])  # "PM1 (atmosphere)"
-        parsed_data["pm25_atm"] = Utility.make_16bit_int(raw_resp[12], raw_resp[13])  # "PM2.5 (atmosphere)"
-        parsed_data["pm100_atm"] = Utility.make_16bit_int(raw_resp[14], raw_resp[15])  # "PM10 (atmosphere)"
-        parsed_data["part03"] = Utility.make_16bit_int(raw_resp[16], raw_resp[17])  # "0.3um particles"
-        parsed_data["part05"] = Utility.make_16bit_int(raw_resp[18], raw_resp[19])  # "0.5um particles"
-        parsed_data["part10"] = Utility.make_16bit_int(raw_resp[20], raw_resp[21])  # "1.0um particles"
-        parsed_data["part25"] = Utility.make_16bit_int(raw_resp[22], raw_resp[23])  # "2.5um particles"
-        parsed_data["part50"] = Utility.make_16bit_int(raw_resp[24], raw_resp[25])  # "5.0um particles"
-        parsed_data["part100"] = Utility.make_16bit_int(raw_resp[26], raw_resp[27])  # "10.0um particles"
-        parsed_data["tvoc"] = Utility.make_16bit_int(raw_resp[28], raw_resp[29]) / 100.0  # "TVOC"  # noqa: E501
-        parsed_data["tvoc_quan"] = int(raw_resp[30])  # "TVOC quantity"
-        parsed_data["hcho"] = Utility.make_16bit_int(raw_resp[31], raw_resp[32]) / 100.0  # "HCHO"  # noqa: E501
-        parsed_data["hcho_quan"] = int(raw_resp[33])  # "HCHO quantity"
-        parsed_data["co2"] = Utility.make_16bit_int(raw_resp[34], raw_resp[35])  # "CO2"
-        parsed_data["temp"] = Utility.make_16bit_int(raw_resp[36], raw_resp[37]) / 10.0  # "Temperature"
-        parsed_data["hum"] = Utility.make_16bit_int(raw_resp[38], raw_resp[39]) / 10.0  # "Humidity"  # noqa: E501
-
+        for name in fields or _RESPONSE_FIELDS:
+            value = values[_RESPONSE_INDEX[name]]
+            scale = _RESPONSE_SCALE.get(name)
+            parsed_data[name] = value / scale if scale else value
         return parsed_data
 
 
 class PTQS1005Driver:
     """PTQS1005Driver class for interacting with the sensor driver."""
 
+    READ_ATTEMPTS = 3
+    READ_TIMEOUT_MS = 1000
+
     def __init__(self, uart: int):
         """Initialize the sensor driver with the specified UART."""
         self.ser = machine.UART(uart, baudrate=9600, bits=8, parity=None, stop=1)
+        self.frame_sync = FrameSync(
+            self.ser,
+            header=bytes([0x42, 0x4d, 0x00, 0x26]),
+            frame_length=42,
+            checksum=ResponseValidator.is_valid_checksum,
+        )
 
     @staticmethod
     def __make_cmd(cmd: int, data: int) -> bytes:
@@ -90,9 +107,18 @@ class PTQS1005Driver:
         return bytes(arr)
 
     def read(self) -> bytes:
-        """Read data from the sensor."""
-        self.__send_command()
-        return self.__read_response()
+        """Read data from the sensor.
+
+        Stale input is dropped before every request and the request is repeated up to READ_ATTEMPTS
+        times, so a single misaligned or corrupted frame does not fail the measurement.
+        """
+        for _ in range(self.READ_ATTEMPTS):
+            self.frame_sync.flush()
+            self.__send_command()
+            response = self.__read_response(self.READ_TIMEOUT_MS)
+            if response is not None:
+                return response
+        raise UartError(f"No valid PTQS1005 response, {self.frame_sync}")
 
     def __send_command(self):
         """Send a command to the sensor."""
@@ -112,12 +138,9 @@ class PTQS1005Driver:
         cmd = machine.Pin(reset_pin, machine.Pin.OUT)
         cmd.value(1)
 
-    def __read_response(self) -> bytes:
-        """Read and return the sensor response."""
-        resp = self.ser.read(42)
-        if len(resp) != 42:
-            raise Exception("Invalid response length")
-        return resp
+    def __read_response(self, timeout_ms: int = 1000) -> bytes:
+        """Read and return the sensor response, None if no valid frame arrived in time."""
+        return self.frame_sync.read(timeout_ms)
 
 
 class PTQS1005Sensor:
@@ -127,14 +150,10 @@ class PTQS1005Sensor:
         """Initialize the sensor with the specified UART."""
         self.driver = PTQS1005Driver(uart)
 
-    def measure(self) -> dict:
-        """Measure sensor data and return a dictionary of measurements."""
-        try:
-            response = self.driver.read()
-        except TypeError:
-            time.sleep(1)
-            response = self.driver.read()
-        return ResponseParser.parse(response)
+    def measure(self, fields: tuple = None) -> dict:
+        """Measure sensor data and return a dictionary of measurements, limited to fields if given."""
+        response = self.driver.read()
+        return ResponseParser.parse(response, fields)
 
     def sleep(self, reset_pin: int):
         """Put the sensor in standby mode."""
@@ -17,8 +17,14 @@ See https://cl.ly/ekot
 
 import ustruct as struct
 import sys
+import time
+from array import array
+
 import machine
 
+from aggregation import robust_median
+from uart_frame import FrameSync
+
 _SDS011_CMDS = {
     "SET": b"\x01",
     "GET": b"\x00",
@@ -29,13 +35,49 @@ _SDS011_CMDS = {
 }
 
 
+def _make_command(cmd, mode, param):
+    """Builds a 19 byte command frame, cmd/mode/param as ints or single
+    bytes."""
+    frame = bytearray(19)
+    frame[0] = 0xAA
+    frame[1] = 0xB4
+    frame[2] = cmd if isinstance(cmd, int) else ord(cmd)
+    frame[3] = mode if isinstance(mode, int) else ord(mode)
+    frame[4] = param if isinstance(param, int) else ord(param)
+    # device id 0xFFFF addresses any sensor
+    frame[15] = 0xFF
+    frame[16] = 0xFF
+    frame[17] = sum(frame[2:17]) % 256
+    frame[18] = 0xAB
+    return bytes(frame)
+
+
+# Command frames never change, build them once
+_CMD_WAKE = _make_command(_SDS011_CMDS["SLEEPWAKE"], _SDS011_CMDS["SET"], 1)
+_CMD_SLEEP = _make_command(_SDS011_CMDS["SLEEPWAKE"], _SDS011_CMDS["SET"], 0)
+_CMD_REPORTING_MODE_QUERY = _make_command(
+    _SDS011_CMDS["REPORTING_MODE"], _SDS011_CMDS["SET"], 1
+)
+_CMD_REPORTING_MODE_ACTIVE = _make_command(
+    _SDS011_CMDS["REPORTING_MODE"], _SDS011_CMDS["SET"], 0
+)
+_CMD_QUERY = _make_command(_SDS011_CMDS["QUERY"], 0, 0)
+_CMD_WORKING_PERIOD_QUERY = _make_command(
+    _SDS011_CMDS["DUTYCYCLE"], _SDS011_CMDS["GET"], 0
+)
+
+_MAX_WORKING_PERIOD = 30  # minutes
+
+_MEASUREMENT_LENGTH = 10
+
+
 class SDS011:
     """A driver for the SDS011 particulate matter sensor.
 
     :param uart: The `UART is` object to use.
     """
 
-    def __init__(self, uart):
+    def __init__(self, uart, max_samples=10):
         self.uart = machine.UART(
             uart, baudrate=9600, bits=8, parity=None, stop=1
         )
@@ -43,6 +85,28 @@ class SDS011:
         self._pm10 = 0.0
         self._packet_status = False
         self._packet = ()
+        self.frame_sync = FrameSync(
+            self.uart,
+            header=b"\xaa\xc0",
+            frame_length=_MEASUREMENT_LENGTH,
+            checksum=SDS011._valid_frame,
+        )
+        # sample buffers reused by sample()
+        self._max_samples = max_samples
+        self._pm25_samples = array("f", [0] * max_samples)
+        self._pm10_samples = array("f", [0] * max_samples)
+        self._scratch = array("f", [0] * max_samples)
+        # replies to commands, AA C5 <command> <GET/SET> <value> ...
+        self.reply_sync = FrameSync(
+            self.uart,
+            header=b"\xaa\xc5",
+            frame_length=_MEASUREMENT_LENGTH,
+            checksum=SDS011._valid_frame,
+        )
+        # working period (duty cycle) bookkeeping, see configure_working_period
+        self._working_period = 0
+        self._last_report = None
+        self._report_pending = False
 
         self.set_reporting_mode_query()
 
@@ -67,77 +131,207 @@ class SDS011:
         return self._packet
 
     def make_command(self, cmd, mode, param):
-        header = b"\xaa\xb4"
-        padding = b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xff"
-        checksum = chr((ord(cmd) + ord(mode) + ord(param) + 255 + 255) % 256)
-        checksum = bytes(checksum, "utf8")
-        tail = b"\xab"
-
-        return header + cmd + mode + param + padding + checksum + tail
+        return _make_command(cmd, mode, param)
 
     def wake(self):
         """Sends wake command to sds011 (starts its fan)."""
-        cmd = self.make_command(
-            _SDS011_CMDS["SLEEPWAKE"], _SDS011_CMDS["SET"], chr(1)
-        )
-        self.uart.write(cmd)
+        self.uart.write(_CMD_WAKE)
 
     def sleep(self):
         """Sends sleep command to sds011 (stops its fan)."""
-        cmd = self.make_command(
-            _SDS011_CMDS["SLEEPWAKE"], _SDS011_CMDS["SET"], chr(0)
-        )
-        self.uart.write(cmd)
+        self.uart.write(_CMD_SLEEP)
 
     def set_reporting_mode_query(self):
-        cmd = self.make_command(
-            _SDS011_CMDS["REPORTING_MODE"], _SDS011_CMDS["SET"], chr(1)
-        )
-        self.uart.write(cmd)
+        self.uart.write(_CMD_REPORTING_MODE_QUERY)
+
+    def set_reporting_mode_active(self):
+        self.uart.write(_CMD_REPORTING_MODE_ACTIVE)
 
     def query(self):
         """Query new measurement data"""
-        cmd = self.make_command(_SDS011_CMDS["QUERY"], chr(0), chr(0))
-        self.uart.write(cmd)
+        self.uart.write(_CMD_QUERY)
+
+    def set_working_period(self, minutes):
+        """
+        Sets the working period of the sensor, 0 (continuous) or 1-30 minutes.
+
+        With a working period the sensor sleeps on its own, runs its fan for
+        30 s at the end of every period and reports one measurement. The
+        setting is stored in the sensor flash, only send it when it changes.
+        """
+        if not 0 <= minutes <= _MAX_WORKING_PERIOD:
+            raise ValueError(
+                f"Working period should be between 0 and {_MAX_WORKING_PERIOD} minutes"
+            )
+        self.uart.write(
+            _make_command(_SDS011_CMDS["DUTYCYCLE"], _SDS011_CMDS["SET"], minutes)
+        )
+        self._working_period = minutes
+        self._last_report = None
+
+    def get_working_period(self, timeout_ms=1000):
+        """
+        Queries the working period stored in the sensor, which has to be
+        awake to answer.
+
+        Return the period in minutes, None if no reply arrived within
+        timeout_ms.
+        """
+        self.reply_sync.flush()
+        self.uart.write(_CMD_WORKING_PERIOD_QUERY)
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        while True:
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                return None
+            frame = self.reply_sync.read(remaining)
+            if frame is None:
+                return None
+            # skip the replies to the commands sent before
+            if frame[2] == ord(_SDS011_CMDS["DUTYCYCLE"]) and frame[3] == 0:
+                return frame[4]
+
+    def configure_working_period(self, minutes):
+        """
+        Wakes the sensor up and makes sure its working period is minutes.
+        The period is only written when the stored one differs, the sensor
+        flash has limited write cycles and the board resets daily.
+
+        With a working period the fan is handed over to the sensor, which
+        reports in active mode. With 0 the sensor stays in query mode and is
+        put back to sleep, a period left in its flash would otherwise keep
+        waking it up.
+        """
+        self.wake()
+        if minutes:
+            self.set_reporting_mode_active()
+        if self.get_working_period() != minutes:
+            self.set_working_period(minutes)
+        self._working_period = minutes
+        self._last_report = None
+        if not minutes:
+            self.sleep()
+
+    def poll_report(self):
+        """
+        Processes the measurements the sensor reported on its own since the
+        last call, without sending anything and without waiting, and records
+        when they arrived to schedule the next one.
+
+        Return True if a valid measurement has been received.
+        """
+        received = False
+        while self.uart.any():
+            frame = self.frame_sync.read(0)
+            if frame is not None:
+                self._process_frame(frame)
+                received = received or self._packet_status
+        if received:
+            self._last_report = time.ticks_ms()
+            self._report_pending = True
+        return received
+
+    def read_report(self):
+        """
+        Processes the pending reports like poll_report.
+
+        Return True if a valid measurement has been received since the last
+        call, including the ones already picked up by poll_report.
+        """
+        self.poll_report()
+        received = self._report_pending
+        self._report_pending = False
+        return received
+
+    def ms_until_report(self):
+        """
+        Returns the milliseconds until the next report is expected in
+        working period mode (negative when overdue), None while the schedule
+        is not known yet.
+        """
+        if not self._working_period or self._last_report is None:
+            return None
+        period_ms = self._working_period * 60000
+        return period_ms - time.ticks_diff(time.ticks_ms(), self._last_report)
+
+    @staticmethod
+    def _valid_frame(frame):
+        """Checks the checksum (low byte of the sum of the 6 data bytes) and
+        the tail of a measurement frame, without slicing it."""
+        checksum = frame[2] + frame[3] + frame[4] + frame[5] + frame[6] + frame[7]
+        return frame[9] == 0xAB and checksum % 256 == frame[8]
+
+    def _process_frame(self, frame):
+        self._packet_status = self._valid_frame(frame)
+        if self._packet_status:
+            pm25, pm10 = struct.unpack_from("<HH", frame, 2)
+            self._pm25 = pm25 / 10.0
+            self._pm10 = pm10 / 10.0
 
     def process_measurement(self, packet):
+        """Processes the 8 bytes following the measurement header, the PM
+        values are only updated when the packet is valid."""
         try:
-            *data, checksum, tail = struct.unpack("<HHBBBs", packet)
-            self._pm25 = data[0] / 10.0
-            self._pm10 = data[1] / 10.0
-            checksum_ok = checksum == (sum(data) % 256)
-            tail_ok = tail == b"\xab"
-            self._packet_status = checksum_ok and tail_ok
+            frame = bytearray(_MEASUREMENT_LENGTH)
+            frame[2:] = packet
+            self._process_frame(frame)
         except Exception as e:
             print("Problem decoding packet:", e)
             sys.print_exception(e)
 
-    def read(self):
+    def read(self, timeout_ms=1000):
         """
         Query a new measurement, wait for a response and process it.
-        Waits for a response during 512 characters (0.4s at 9600bauds).
-        
-        Return True if a response has been received, False over wise.
+        Waits for a response during timeout_ms.
+
+        Return True if a valid response has been received, False over wise.
         """
         # Query measurement
         self.query()
 
-        # Read measurement
-        # Drops up to 512 characters before giving up finding a measurement pkt...
-        for _ in range(512):
-            try:
-                header = self.uart.read(1)
-                if header == b"\xaa":
-                    command = self.uart.read(1)
-
-                    if command == b"\xc0":
-                        packet = self.uart.read(8)
-                        if packet is not None:
-                            self.process_measurement(packet)
-                            return True
-            except Exception as e:
-                print("Problem attempting to read:", e)
-                sys.print_exception(e)
-
-        # If we gave up finding a measurement pkt
-        return False
+        # Read measurement, garbage and corrupted packets are dropped
+        frame = self.frame_sync.read(timeout_ms)
+        if frame is None:
+            print("No measurement packet received:", self.frame_sync)
+            self._packet_status = False
+            return False
+
+        self._process_frame(frame)
+        return self._packet_status
+
+    def sample(self, count=10, interval_ms=1000):
+        """
+        Queries up to count measurements (capped at max_samples), interval_ms
+        apart, and reduces the valid ones to their median after MAD outlier
+        rejection.
+
+        Return a dict with pm25, pm10, the number of valid samples and the
+        median absolute deviation of both channels, None if no valid
+        measurement was received.
+        """
+        count = min(count, self._max_samples)
+        valid = 0
+        for index in range(count):
+            if index:
+                time.sleep_ms(interval_ms)
+            if self.read():
+                self._pm25_samples[valid] = self._pm25
+                self._pm10_samples[valid] = self._pm10
+                valid += 1
+
+        if not valid:
+            return None
+
+        pm25, pm25_kept, pm25_spread = robust_median(
+            self._pm25_samples, valid, self._scratch
+        )
+        pm10, pm10_kept, pm10_spread = robust_median(
+            self._pm10_samples, valid, self._scratch
+        )
+        return {
+            "pm25": pm25,
+            "pm10": pm10,
+            "samples": min(pm25_kept, pm10_kept),
+            "pm25_spread": pm25_spread,
+            "pm10_spread": pm10_spread,
+        }
@@ -0,0 +1,119 @@
+"""
+Frame synchronisation for UART sensors.
+
+The particle sensors (PMS7003, SDS011, PTQS1005) all stream fixed length
+frames starting with a known header. FrameSync reads the UART straight
+into a preallocated buffer, drops garbage in front of the header in place
+and gives up once its deadline expires, so an unplugged or wedged sensor
+costs a timeout instead of hanging the station.
+"""
+
+import time
+
+
+class FrameSync:
+    """Finds frames in a UART byte stream.
+
+    :param uart: The machine.UART the sensor is connected to.
+    :param header: The bytes every frame starts with.
+    :param frame_length: The length of a whole frame, header included.
+    :param checksum: Optional callable taking a memoryview of the frame and
+        returning True if the frame is valid.
+    """
+
+    POLL_PERIOD_MS = 5
+
+    def __init__(self, uart, header, frame_length, checksum=None):
+        self.uart = uart
+        self.header = header
+        self.frame_length = frame_length
+        self.checksum = checksum
+        self.frame = bytearray(frame_length)
+        self._view = memoryview(self.frame)
+        # the free end of the buffer for every fill level, slicing a
+        # memoryview allocates on MicroPython
+        self._tails = [self._view[start:] for start in range(frame_length)]
+        self._length = 0
+
+        self.frames = 0
+        self.discarded = 0
+        self.checksum_errors = 0
+        self.timeouts = 0
+
+    def __repr__(self):
+        return (
+            f"FrameSync(frames={self.frames}, discarded={self.discarded}, "
+            f"checksum_errors={self.checksum_errors}, timeouts={self.timeouts})"
+        )
+
+    def _find_header(self):
+        """Returns the offset of the first (possibly partial) header in the
+        buffered bytes."""
+        frame = self.frame
+        header = self.header
+        header_length = len(header)
+        first = header[0]
+        length = self._length
+        for offset in range(length):
+            # most offsets fail on the first byte, test it before the rest
+            if frame[offset] != first:
+                continue
+            matched = 1
+            while (
+                matched < header_length
+                and offset + matched < length
+                and frame[offset + matched] == header[matched]
+            ):
+                matched += 1
+            if matched == header_length or offset + matched == length:
+                return offset
+        return length
+
+    def _shift(self, count):
+        """Drops count bytes from the front of the buffer in place."""
+        frame = self.frame
+        remaining = self._length - count
+        for index in range(remaining):
+            frame[index] = frame[count + index]
+        self._length = remaining
+        self.discarded += count
+
+    def flush(self):
+        """Drops buffered bytes and everything waiting in the UART."""
+        self._length = 0
+        while self.uart.any():
+            self.uart.readinto(self.frame)
+
+    def read(self, timeout_ms=1000):
+        """Reads the next valid frame.
+
+        Returns:
+            bytearray: The frame buffer (reused by the next read), or None if
+            no valid frame arrived within timeout_ms.
+        """
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+
+        while True:
+            if self._length < self.frame_length:
+                read_bytes = self.uart.readinto(self._tails[self._length])
+                if read_bytes:
+                    self._length += read_bytes
+
+            start = self._find_header()
+            if start:
+                self._shift(start)
+
+            if self._length == self.frame_length:
+                if self.checksum is None or self.checksum(self._view):
+                    self._length = 0
+                    self.frames += 1
+                    return self.frame
+                # skip the header of the corrupted frame and look for the next one
+                self.checksum_errors += 1
+                self._shift(1)
+
+            if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+                self.timeouts += 1
+                return None
+            if self._length < self.frame_length and not self.uart.any():
+                time.sleep_ms(self.POLL_PERIOD_MS)
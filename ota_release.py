@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""Host-side OTA release builder and local update server.
+
+Builds a versioned release of the ``micropython/`` tree in the layout
+expected by ``micropython_ota.ota_update`` and optionally serves it over
+HTTP, so an update can be exercised end-to-end (for example against the
+unix port of MicroPython) before it is published.
+
+Example usage:
+
+    ./ota_release.py build --output release
+    ./ota_release.py build --output release --compress --mpy
+    ./ota_release.py serve --directory release --port 8000
+
+The device side is then pointed at ``http://<host>:8000`` with the project
+name used during the build (``home_air_monitor_micropython`` by default).
+"""
+
+import argparse
+import email.utils
+import functools
+import hashlib
+import http.server
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micropython")
+DEFAULT_PROJECT = "home_air_monitor_micropython"
+MANIFEST_NAME = "manifest.json"
+COMPRESSED_SUFFIX = ".z"
+PRECOMPILED_SUFFIX = ".mpy"
+# Device specific configuration, never part of a release
+EXCLUDED_FILES = ("constants.py",)
+# MicroPython only runs these as source files
+SOURCE_ONLY_FILES = ("boot.py", "main.py")
+# A 1 KiB deflate window keeps the decompressor small on the device
+COMPRESSION_WBITS = 10
+
+logger = logging.getLogger("ota_release")
+
+
+def read_version(source):
+    """Return the version stored in the ``version`` file of the source
+    tree."""
+    with open(os.path.join(source, "version")) as version_file:
+        return version_file.readline().strip()
+
+
+def list_source_files(source, excluded=EXCLUDED_FILES):
+    """Return the top level python files of the source tree in a stable
+    order."""
+    return sorted(
+        filename
+        for filename in os.listdir(source)
+        if filename.endswith(".py") and filename not in excluded
+    )
+
+
+def release_path(project_dir, version, filename, use_version_prefix=True):
+    """Return the path of a release file, following the naming used by
+    ``micropython_ota``."""
+    if use_version_prefix:
+        return os.path.join(project_dir, f"{version}_{filename}")
+    return os.path.join(project_dir, version, filename)
+
+
+def describe(data):
+    """Return the size and sha256 of a payload as stored in the
+    manifest."""
+    return {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def compress(data):
+    """Compress a payload in the zlib format understood by
+    ``deflate.DeflateIO``."""
+    compressor = zlib.compressobj(level=9, wbits=COMPRESSION_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def precompile(path, mpy_cross):
+    """Compile a source file with mpy-cross and return the bytecode."""
+    output = path + PRECOMPILED_SUFFIX
+    try:
+        subprocess.run([mpy_cross, "-o", output, path], check=True)
+        with open(output, "rb") as mpy_file:
+            return mpy_file.read()
+    finally:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+def build_release(
+    source,
+    output,
+    project=DEFAULT_PROJECT,
+    version=None,
+    filenames=None,
+    use_version_prefix=True,
+    compressed=False,
+    mpy_cross=None,
+):
+    """Build a release directory and return its manifest.
+
+    Parameters:
+        source (str): The micropython source tree.
+        output (str): The directory served as the OTA host.
+        project (str): The project name, used as the top level directory.
+        version (str): The release version, read from the source tree when omitted.
+        filenames (list): The files to release, all python files when omitted.
+        use_version_prefix (bool): Name files ``<version>_<file>`` instead of ``<version>/<file>``.
+        compressed (bool): Also write deflate-compressed variants of every file.
+        mpy_cross (str): Path to mpy-cross, also writes precompiled variants when given.
+
+    Returns:
+        dict: The manifest written next to the released files.
+    """
+    version = version or read_version(source)
+    filenames = filenames or list_source_files(source)
+    project_dir = os.path.join(output, project)
+    if not use_version_prefix:
+        os.makedirs(os.path.join(project_dir, version), exist_ok=True)
+    os.makedirs(project_dir, exist_ok=True)
+
+    manifest = {"version": version, "files": {}}
+    for filename in filenames:
+        source_path = os.path.join(source, filename)
+        with open(source_path, "rb") as source_file:
+            data = source_file.read()
+        target = release_path(project_dir, version, filename, use_version_prefix)
+        with open(target, "wb") as target_file:
+            target_file.write(data)
+        entry = describe(data)
+
+        if compressed:
+            compressed_data = compress(data)
+            with open(target + COMPRESSED_SUFFIX, "wb") as target_file:
+                target_file.write(compressed_data)
+            entry["compressed"] = describe(compressed_data)
+
+        if mpy_cross and filename not in SOURCE_ONLY_FILES:
+            precompiled_data = precompile(source_path, mpy_cross)
+            with open(target[: -len(".py")] + PRECOMPILED_SUFFIX, "wb") as target_file:
+                target_file.write(precompiled_data)
+            entry["precompiled"] = describe(precompiled_data)
+
+        manifest["files"][filename] = entry
+        logger.info(
+            "%s: %d bytes%s",
+            filename,
+            entry["size"],
+            f", {entry['compressed']['size']} compressed" if compressed else "",
+        )
+
+    with open(
+        release_path(project_dir, version, MANIFEST_NAME, use_version_prefix), "w"
+    ) as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    # The version file is written last, devices only see a complete release
+    with open(os.path.join(project_dir, "version"), "w") as version_file:
+        version_file.write(version + "\n")
+
+    total = sum(entry["size"] for entry in manifest["files"].values())
+    logger.info("Release %s: %d files, %d bytes", version, len(filenames), total)
+    if compressed:
+        total_compressed = sum(
+            entry["compressed"]["size"] for entry in manifest["files"].values()
+        )
+        logger.info(
+            "Compressed: %d bytes (%.1fx)",
+            total_compressed,
+            total / max(total_compressed, 1),
+        )
+    return manifest
+
+
+class ReleaseRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves a release directory with ETag validation and transfer
+    accounting."""
+
+    server_version = "OTARelease/1.0"
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+        self._etag = etag
+        start = self.range_start()
+        if start is None:
+            return super().send_head()
+        if start >= stat.st_size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{stat.st_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        source = open(path, "rb")
+        source.seek(start)
+        self.send_response(206)
+        self.send_header("Content-type", self.guess_type(path))
+        self.send_header("Content-Length", str(stat.st_size - start))
+        self.send_header(
+            "Content-Range", f"bytes {start}-{stat.st_size - 1}/{stat.st_size}"
+        )
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        return source
+
+    def range_start(self):
+        """Return the offset of an open ended ``bytes=N-`` range request,
+        other ranges are served as a full response."""
+        value = self.headers.get("Range", "")
+        if not value.startswith("bytes=") or not value.endswith("-"):
+            return None
+        try:
+            return int(value[len("bytes=") : -1])
+        except ValueError:
+            return None
+
+    def end_headers(self):
+        etag = getattr(self, "_etag", None)
+        if etag:
+            self.send_header("ETag", etag)
+            self._etag = None
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        start = time.monotonic()
+        sent = 0
+        limit = self.server.drop_after
+        while chunk := source.read(64 * 1024):
+            if limit and sent + len(chunk) > limit:
+                # Simulate a connection dropped mid-transfer
+                outputfile.write(chunk[: limit - sent])
+                sent = limit
+                self.close_connection = True
+                break
+            outputfile.write(chunk)
+            sent += len(chunk)
+        self.server.account(self.path, sent, time.monotonic() - start)
+
+    def log_message(self, format, *args):  # noqa: A002
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+class ReleaseServer(http.server.ThreadingHTTPServer):
+    """HTTP server keeping per-file transfer statistics."""
+
+    def __init__(self, server_address, directory, drop_after=0):
+        handler = functools.partial(ReleaseRequestHandler, directory=directory)
+        super().__init__(server_address, handler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.transfer_time = 0.0
+        self.drop_after = drop_after
+
+    def account(self, path, sent, elapsed):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += sent
+            self.transfer_time += elapsed
+        logger.info("%s: %d bytes in %.3f s", path, sent, elapsed)
+
+    def summary(self):
+        return f"{self.requests} transfers, {self.bytes_sent} bytes, {self.transfer_time:.3f} s"
+
+
+def serve(directory, host="0.0.0.0", port=8000, drop_after=0):
+    """Serve a release directory until interrupted.
+
+    With ``drop_after`` every response is cut after that many bytes, which
+    exercises resumed downloads on the device.
+    """
+    server = ReleaseServer((host, port), directory, drop_after=drop_after)
+    logger.info(
+        "Serving %s on http://%s:%d at %s",
+        directory,
+        host,
+        port,
+        email.utils.formatdate(usegmt=True),
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Served %s", server.summary())
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO, format="[%(levelname)s]:%(name)s:%(message)s"
+    )
+    cmd_parser = argparse.ArgumentParser(description="Build and serve OTA releases.")
+    commands = cmd_parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser(
+        "build", help="build a versioned release directory"
+    )
+    build_parser.add_argument(
+        "-s", "--source", default=DEFAULT_SOURCE, help="the micropython source tree"
+    )
+    build_parser.add_argument(
+        "-o", "--output", required=True, help="the release directory"
+    )
+    build_parser.add_argument(
+        "-p", "--project", default=DEFAULT_PROJECT, help="the OTA project name"
+    )
+    build_parser.add_argument(
+        "-v", "--version", help="the release version [default: the source version file]"
+    )
+    build_parser.add_argument(
+        "-f",
+        "--files",
+        nargs="+",
+        help="the files to release [default: all python files]",
+    )
+    build_parser.add_argument(
+        "--no-version-prefix",
+        action="store_false",
+        dest="use_version_prefix",
+        help="store files as <version>/<file> instead of <version>_<file>",
+    )
+    build_parser.add_argument(
+        "--compress", action="store_true", help="also write deflate-compressed files"
+    )
+    build_parser.add_argument(
+        "--mpy",
+        nargs="?",
+        const=shutil.which("mpy-cross") or "mpy-cross",
+        dest="mpy_cross",
+        help="also write precompiled files, optionally with the path to mpy-cross",
+    )
+    build_parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="remove the previous release of the project first",
+    )
+
+    serve_parser = commands.add_parser(
+        "serve", help="serve a release directory over HTTP"
+    )
+    serve_parser.add_argument(
+        "-d", "--directory", required=True, help="the release directory"
+    )
+    serve_parser.add_argument(
+        "--host", default="0.0.0.0", help="the address to bind to"
+    )
+    serve_parser.add_argument(
+        "--port", default=8000, type=int, help="the port to listen on"
+    )
+    serve_parser.add_argument(
+        "--drop-after",
+        default=0,
+        type=int,
+        help="cut every response after this many bytes to simulate a flaky link",
+    )
+
+    args = cmd_parser.parse_args()
+
+    if args.command == "build":
+        if args.clean:
+            shutil.rmtree(os.path.join(args.output, args.project), ignore_errors=True)
+        build_release(
+            args.source,
+            args.output,
+            project=args.project,
+            version=args.version,
+            filenames=args.files,
+            use_version_prefix=args.use_version_prefix,
+            compressed=args.compress,
+            mpy_cross=args.mpy_cross,
+        )
+    elif args.command == "serve":
+        serve(
+            args.directory, host=args.host, port=args.port, drop_after=args.drop_after
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+BME680 compensation cost per sample, the original formulas against the
+folded calibration terms of the driver.
+
+Run on CPython or on the unix port of MicroPython:
+
+    python tests/bench_bme680.py
+    micropython tests/bench_bme680.py
+"""
+
+import time
+
+import fakes
+
+fakes.install()
+
+import bme680_reference as reference  # noqa: E402
+from test_bme680 import TPH_ADC, make_sensor  # noqa: E402
+
+ROUNDS = 500
+
+
+def original(c, temperature_adc, pressure_adc, humidity_adc, gas_adc, gas_range):
+    temperature, t_fine = reference.temperature(c, temperature_adc)
+    return (
+        temperature,
+        reference.pressure(c, t_fine, pressure_adc),
+        reference.humidity(c, t_fine, humidity_adc),
+        reference.gas_resistance(c, gas_adc, gas_range),
+    )
+
+
+def folded(sensor, temperature_adc, pressure_adc, humidity_adc, gas_adc, gas_range):
+    return (
+        sensor._calc_temperature(temperature_adc),
+        sensor._calc_pressure(pressure_adc),
+        sensor._calc_humidity(humidity_adc),
+        sensor._calc_gas_resistance(gas_adc, gas_range),
+    )
+
+
+def bench(name, function, target):
+    samples = TPH_ADC[1:-1]
+    start = time.ticks_us()
+    for _ in range(ROUNDS):
+        for temperature_adc, pressure_adc, humidity_adc in samples:
+            function(target, temperature_adc, pressure_adc, humidity_adc, 512, 5)
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    per_sample = elapsed / (ROUNDS * len(samples))
+    print("{:<10} {:8.2f} us per sample".format(name, per_sample))
+    return per_sample
+
+
+def main():
+    sensor, _ = make_sensor()
+    before = bench("original", original, sensor.calibration_data)
+    after = bench("folded", folded, sensor)
+    print("speedup {:.2f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Per-transaction latency of the I2C layers on a loopback fake bus.
+
+Run on CPython or on the unix port of MicroPython:
+
+    python tests/bench_i2c.py
+    micropython tests/bench_i2c.py
+
+The fake bus costs the same for every layer, the difference between the
+rows is the Python overhead of I2CAdapter and I2CArbiter. The time spent
+on the wire, which the bus frequency changes, is estimated from the bits
+every transaction clocks out.
+"""
+
+import time
+
+import fakes
+
+fakes.install()
+
+from i2c import DEFAULT_FREQUENCY, MAX_FREQUENCY, I2CAdapter, I2CArbiter  # noqa: E402
+
+ADDR = 0x77
+ROUNDS = 2000
+
+
+def bench(name, transaction):
+    start = time.ticks_us()
+    for _ in range(ROUNDS):
+        transaction()
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    print("{:<36} {:8.2f} us".format(name, elapsed / ROUNDS))
+
+
+def wire_us(nbytes, freq, read=True):
+    """Estimated bus time of a register access, 9 clocks per byte plus the
+    start, stop and repeated start conditions."""
+    # address + register, then address again for a read
+    clocks = 9 * (2 + nbytes + (1 if read else 0)) + 3
+    return clocks * 1000000 / freq
+
+
+def main():
+    adapter = I2CAdapter(scl=22, sda=21)
+    arbiter = I2CArbiter(adapter)
+    bus = adapter.bus
+    byte = bytearray(1)
+    field = bytearray(15)
+
+    print("Python overhead per transaction, {} rounds".format(ROUNDS))
+    bench(
+        "bus.readfrom_mem_into (1 byte)",
+        lambda: bus.readfrom_mem_into(ADDR, 0x1D, byte),
+    )
+    bench("adapter.read_byte_data", lambda: adapter.read_byte_data(ADDR, 0x1D))
+    bench("arbiter.read_byte_data", lambda: arbiter.read_byte_data(ADDR, 0x1D))
+    bench("adapter.write_byte_data", lambda: adapter.write_byte_data(ADDR, 0x74, 0x25))
+    bench("arbiter.write_byte_data", lambda: arbiter.write_byte_data(ADDR, 0x74, 0x25))
+    bench(
+        "bus.readfrom_mem_into (15 bytes)",
+        lambda: bus.readfrom_mem_into(ADDR, 0x1D, field),
+    )
+    bench("adapter.read_into (15 bytes)", lambda: adapter.read_into(ADDR, 0x1D, field))
+    bench("arbiter.read_into (15 bytes)", lambda: arbiter.read_into(ADDR, 0x1D, field))
+
+    print("Estimated wire time")
+    for freq in (DEFAULT_FREQUENCY, MAX_FREQUENCY):
+        print(
+            "{:>6} Hz: 1 byte read {:6.1f} us, 15 byte read {:6.1f} us, 1 byte write {:6.1f} us".format(
+                freq, wire_us(1, freq), wire_us(15, freq), wire_us(1, freq, read=False)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
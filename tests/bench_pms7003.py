@@ -0,0 +1,89 @@
+"""
+PMS7003 frame reading, the original byte by byte reader against the
+preallocated frame buffer, on a stream with noise between the frames and
+a corrupted frame now and then.
+
+Run on CPython or on the unix port of MicroPython, which also reports the
+bytes allocated per frame:
+
+    python tests/bench_pms7003.py
+    micropython tests/bench_pms7003.py
+
+The timings use a UART copying in C like machine.UART, the allocations the
+fake UART, which copies byte by byte so that it allocates nothing itself.
+"""
+
+import time
+from array import array
+
+import fakes
+
+fakes.install()
+
+import uart_reference as reference  # noqa: E402
+from pms7003 import Pms7003  # noqa: E402
+
+FRAMES = 300
+
+
+def bench(name, read):
+    start = time.ticks_us()
+    for _ in range(FRAMES):
+        read()
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    print("{:<22} {:8.1f} us per frame".format(name, elapsed / FRAMES))
+
+
+def allocation(name, make_read):
+    read = make_read()
+
+    def read_all():
+        for _ in range(FRAMES):
+            read()
+
+    allocated = fakes.allocated_by(read_all)
+    if allocated is not None:
+        print("{:<22} {:8.1f} bytes per frame".format(name, allocated / FRAMES))
+
+
+def main():
+    data = fakes.pms7003_recording(FRAMES)
+
+    def original(uart_class):
+        uart = uart_class()
+        uart.feed(data)
+        return lambda: reference.pms7003_read(uart)
+
+    def sensor_on(uart_class):
+        sensor = Pms7003(uart=2)
+        sensor.uart = sensor.frame_sync.uart = uart_class()
+        sensor.uart.feed(data)
+        return sensor
+
+    def buffered(uart_class):
+        return sensor_on(uart_class).read
+
+    def buffered_into(uart_class):
+        sensor = sensor_on(uart_class)
+        values = array("H", [0] * Pms7003.PMS_VALUES)
+        return lambda: sensor.read_into(values)
+
+    readers = (
+        ("original read", original),
+        ("read", buffered),
+        ("read_into", buffered_into),
+    )
+    check_original = original(fakes.FakeUART)
+    check_buffered = buffered(fakes.FakeUART)
+    for _ in range(FRAMES):
+        assert check_original() == check_buffered()
+
+    print("{} frames, {} bytes".format(FRAMES, len(data)))
+    for name, make_read in readers:
+        bench(name, make_read(fakes.SlicingUART))
+    for name, make_read in readers:
+        allocation(name, lambda: make_read(fakes.FakeUART))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+PTQS1005 response parsing, the original parser against the struct based
+one, for all fields and for the fields main.py sends.
+
+Run on CPython or on the unix port of MicroPython, which also reports the
+bytes allocated per response:
+
+    python tests/bench_ptqs1005.py
+    micropython tests/bench_ptqs1005.py
+"""
+
+import time
+
+import fakes
+
+fakes.install()
+
+import uart_reference as reference  # noqa: E402
+from ptqs1005 import ResponseParser  # noqa: E402
+
+ROUNDS = 500
+# PTQS1005_FIELDS of main.py
+FIELDS = ("pm10_atm", "pm25_atm", "pm100_atm", "tvoc", "hcho", "co2", "temp", "hum")
+
+
+def response(seed=1):
+    stream = fakes.lcg(seed)
+    data = bytearray(42)
+    data[0:4] = bytes([0x42, 0x4D, 0x00, 0x26])
+    for index in range(4, 40):
+        data[index] = next(stream)
+    checksum = sum(data[:40]) & 0xFFFF
+    data[40] = checksum >> 8
+    data[41] = checksum & 0xFF
+    return data
+
+
+def bench(name, parse):
+    start = time.ticks_us()
+    for _ in range(ROUNDS):
+        parse()
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    print("{:<18} {:8.2f} us per response".format(name, elapsed / ROUNDS))
+
+
+def allocation(name, parse):
+    def parse_all():
+        for _ in range(ROUNDS):
+            parse()
+
+    allocated = fakes.allocated_by(parse_all)
+    if allocated is not None:
+        print("{:<18} {:8.1f} bytes per response".format(name, allocated / ROUNDS))
+
+
+def main():
+    data = response()
+    expected = reference.ptqs1005_parse(data)
+    assert ResponseParser.parse(data) == expected
+    assert ResponseParser.parse(data, FIELDS) == {
+        name: expected[name] for name in FIELDS
+    }
+
+    parsers = (
+        ("original parse", lambda: reference.ptqs1005_parse(data)),
+        ("parse", lambda: ResponseParser.parse(data)),
+        ("parse main.py", lambda: ResponseParser.parse(data, FIELDS)),
+    )
+    for name, parse in parsers:
+        bench(name, parse)
+    for name, parse in parsers:
+        allocation(name, parse)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+SDS011 query and read, the original single byte reader against the frame
+buffer, on replies with noise and an answer to an earlier command in
+front of the measurement and a corrupted measurement now and then.
+
+Run on CPython or on the unix port of MicroPython, which also reports the
+bytes allocated per measurement:
+
+    python tests/bench_sds011.py
+    micropython tests/bench_sds011.py
+
+The timings use a UART copying in C like machine.UART, the allocations the
+fake UART, which copies byte by byte so that it allocates nothing itself.
+"""
+
+import time
+
+import fakes
+
+fakes.install()
+
+import uart_reference as reference  # noqa: E402
+from sds011 import SDS011  # noqa: E402
+
+MEASUREMENTS = 300
+
+
+def frame(command, stream):
+    data = bytearray(10)
+    data[0] = 0xAA
+    data[1] = command
+    # the original checksum dropped the high bytes of the PM values, keep
+    # them 0 so both readers accept the same frames
+    data[2] = next(stream)
+    data[4] = next(stream)
+    for index in (6, 7):
+        data[index] = next(stream)
+    data[8] = sum(data[2:8]) % 256
+    data[9] = 0xAB
+    return data
+
+
+def recording(measurements, seed=1):
+    """The replies to measurement queries, every third one behind a
+    command reply, every tenth one behind a measurement with a broken
+    checksum. Noise bytes are never 0xAA, the original reader would take
+    one for the start of a frame."""
+    stream = fakes.lcg(seed)
+    data = bytearray()
+    for index in range(measurements):
+        for _ in range(next(stream) % 8):
+            data.append(next(stream) & 0x7F)
+        if index % 3 == 2:
+            data.extend(frame(0xC5, stream))
+        if index % 10 == 9:
+            broken = frame(0xC0, stream)
+            broken[8] ^= 0xFF
+            data.extend(broken)
+        data.extend(frame(0xC0, stream))
+    return data
+
+
+def original(data, uart_class):
+    uart = uart_class()
+    uart.written = None
+    uart.feed(data)
+
+    def read():
+        # a corrupted measurement costs the original reader another query
+        while True:
+            result = reference.sds011_read(uart)
+            if result[2]:
+                return result[0], result[1]
+
+    return read
+
+
+def buffered(data, uart_class):
+    sensor = SDS011(uart=1)
+    sensor.uart = sensor.frame_sync.uart = sensor.reply_sync.uart = uart_class()
+    sensor.uart.written = None
+    sensor.uart.feed(data)
+
+    def read():
+        sensor.read()
+        return sensor.pm25, sensor.pm10
+
+    return read
+
+
+def bench(name, read):
+    start = time.ticks_us()
+    for _ in range(MEASUREMENTS):
+        read()
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    print("{:<16} {:8.1f} us per measurement".format(name, elapsed / MEASUREMENTS))
+
+
+def allocation(name, read):
+    def read_all():
+        for _ in range(MEASUREMENTS):
+            read()
+
+    allocated = fakes.allocated_by(read_all)
+    if allocated is not None:
+        print(
+            "{:<16} {:8.1f} bytes per measurement".format(
+                name, allocated / MEASUREMENTS
+            )
+        )
+
+
+def main():
+    data = recording(MEASUREMENTS)
+    check_original = original(data, fakes.FakeUART)
+    check_buffered = buffered(data, fakes.FakeUART)
+    for _ in range(MEASUREMENTS):
+        assert check_original() == check_buffered()
+
+    print("{} measurements, {} bytes".format(MEASUREMENTS, len(data)))
+    readers = (("original read", original), ("read", buffered))
+    for name, make_read in readers:
+        bench(name, make_read(data, fakes.SlicingUART))
+    for name, make_read in readers:
+        allocation(name, make_read(data, fakes.FakeUART))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+The BME680 compensation formulas as they were before the calibration
+terms were folded into precomputed constants, kept verbatim as the
+reference the driver has to match bit for bit.
+
+Every function takes the CalibrationData of a sensor and returns what the
+original method returned, temperature() also returns t_fine.
+"""
+
+from bme680_constants import lookupTable1, lookupTable2
+
+
+def temperature(c, temperature_adc):
+    var1 = (temperature_adc >> 3) - (c.par_t1 << 1)
+    var2 = (var1 * c.par_t2) >> 11
+    var3 = ((var1 >> 1) * (var1 >> 1)) >> 12
+    var3 = (var3 * (c.par_t3 << 4)) >> 14
+
+    t_fine = var2 + var3
+    calc_temp = ((t_fine * 5) + 128) >> 8
+
+    return calc_temp, t_fine
+
+
+def pressure(c, t_fine, pressure_adc):
+    var1 = (t_fine >> 1) - 64000
+    var2 = ((((var1 >> 2) * (var1 >> 2)) >> 11) * c.par_p6) >> 2
+    var2 = var2 + ((var1 * c.par_p5) << 1)
+    var2 = (var2 >> 2) + (c.par_p4 << 16)
+    var1 = ((((var1 >> 2) * (var1 >> 2)) >> 13) * (c.par_p3 << 5) >> 3) + (
+        (c.par_p2 * var1) >> 1
+    )
+    var1 = var1 >> 18
+
+    var1 = ((32768 + var1) * c.par_p1) >> 15
+    calc_pressure = 1048576 - pressure_adc
+    calc_pressure = (calc_pressure - (var2 >> 12)) * 3125
+
+    if calc_pressure >= (1 << 31):
+        calc_pressure = (calc_pressure // var1) << 1
+    else:
+        calc_pressure = (calc_pressure << 1) // var1
+
+    var1 = (c.par_p9 * (((calc_pressure >> 3) * (calc_pressure >> 3)) >> 13)) >> 12
+    var2 = ((calc_pressure >> 2) * c.par_p8) >> 13
+    var3 = (
+        (calc_pressure >> 8) * (calc_pressure >> 8) * (calc_pressure >> 8) * c.par_p10
+    ) >> 17
+
+    calc_pressure = calc_pressure + ((var1 + var2 + var3 + (c.par_p7 << 7)) >> 4)
+
+    return calc_pressure
+
+
+def humidity(c, t_fine, humidity_adc):
+    temp_scaled = ((t_fine * 5) + 128) >> 8
+    var1 = (humidity_adc - (c.par_h1 * 16)) - (((temp_scaled * c.par_h3) // 100) >> 1)
+    var2 = (
+        c.par_h2
+        * (
+            ((temp_scaled * c.par_h4) // 100)
+            + (((temp_scaled * ((temp_scaled * c.par_h5) // 100)) >> 6) // 100)
+            + (1 * 16384)
+        )
+    ) >> 10
+    var3 = var1 * var2
+    var4 = c.par_h6 << 7
+    var4 = (var4 + ((temp_scaled * c.par_h7) // 100)) >> 4
+    var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
+    var6 = (var4 * var5) >> 1
+    calc_hum = (((var3 + var6) >> 10) * 1000) >> 12
+
+    return min(max(calc_hum, 0), 100000)
+
+
+def gas_resistance(c, gas_res_adc, gas_range):
+    var1 = ((1340 + (5 * c.range_sw_err)) * (lookupTable1[gas_range])) >> 16
+    var2 = ((gas_res_adc << 15) - 16777216) + var1
+    var3 = (lookupTable2[gas_range] * var1) >> 9
+    calc_gas_res = (var3 + (var2 >> 1)) / var2
+
+    return calc_gas_res
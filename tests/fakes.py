@@ -0,0 +1,290 @@
+"""
+Test doubles for running the drivers off the board.
+
+The tests run on CPython with pytest, or one file at a time on the unix
+port of MicroPython (micropython tests/test_i2c.py), which is needed for
+the allocation checks. install() puts the micropython/ sources on the
+path and provides what neither of them has: the machine peripherals and,
+on CPython, the MicroPython flavoured time, ustruct and micropython
+functions.
+"""
+
+import sys
+import time
+
+_HERE = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+SOURCE = _HERE + "/../micropython"
+
+
+class FakeI2C:
+    """Loopback I2C bus, every device is 256 bytes of registers.
+
+    Nothing is allocated per transaction unless log is a list, it then
+    collects ("r" or "w", addr, register, data) for every transaction.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.devices = {}
+        self.log = None
+
+    def device(self, addr):
+        registers = self.devices.get(addr)
+        if registers is None:
+            registers = self.devices[addr] = bytearray(256)
+        return registers
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        buf = bytearray(nbytes)
+        self.readfrom_into(addr, buf, stop)
+        return bytes(buf)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self.readfrom_mem_into(addr, 0, buf)
+
+    def writeto(self, addr, buf, stop=True):
+        # the first byte selects the register, like the SMBus devices on the station
+        if len(buf) > 1:
+            self.writeto_mem(addr, buf[0], memoryview(buf)[1:])
+        return len(buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        registers = self.device(addr)
+        for index in range(len(buf)):
+            buf[index] = registers[memaddr + index]
+        if self.log is not None:
+            self.log.append(("r", addr, memaddr, bytes(buf)))
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        registers = self.device(addr)
+        for index in range(len(buf)):
+            registers[memaddr + index] = buf[index]
+        if self.log is not None:
+            self.log.append(("w", addr, memaddr, bytes(buf)))
+
+
+class FakeUART:
+    """Loopback UART, feed() queues the bytes the sensor sends.
+
+    readinto(), any() and write() allocate nothing once written is set to
+    None, read() allocates its result like machine.UART does.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.rx = bytearray()
+        self.position = 0
+        self.written = []
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def feed(self, data):
+        self.rx.extend(data)
+
+    def any(self):
+        return len(self.rx) - self.position
+
+    def readinto(self, buf, nbytes=None):
+        count = min(len(buf) if nbytes is None else nbytes, self.any())
+        if not count:
+            return None
+        rx = self.rx
+        position = self.position
+        for index in range(count):
+            buf[index] = rx[position + index]
+        self.position = position + count
+        return count
+
+    def read(self, nbytes=None):
+        available = self.any()
+        if not available:
+            return None
+        count = available if nbytes is None else min(nbytes, available)
+        data = bytes(self.rx[self.position : self.position + count])
+        self.position += count
+        return data
+
+    def write(self, data):
+        if self.written is not None:
+            self.written.append(bytes(data))
+        return len(data)
+
+
+class SlicingUART(FakeUART):
+    """FakeUART with readinto() copying in C like machine.UART, for
+    timings. Unlike FakeUART it allocates the slice it copies."""
+
+    def readinto(self, buf, nbytes=None):
+        count = min(len(buf) if nbytes is None else nbytes, self.any())
+        if not count:
+            return None
+        position = self.position
+        buf[:count] = self.rx[position : position + count]
+        self.position = position + count
+        return count
+
+
+class FakePin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    IRQ_FALLING = 2
+
+    def __init__(self, *args, **kwargs):
+        self._value = 1
+
+    def value(self, *args):
+        if args:
+            self._value = args[0]
+        return self._value
+
+    def irq(self, *args, **kwargs):
+        pass
+
+
+class FakeMachine:
+    """Stands in for the machine module."""
+
+    I2C = FakeI2C
+    SoftI2C = FakeI2C
+    UART = FakeUART
+    Pin = FakePin
+
+    def lightsleep(*args):
+        pass
+
+    def reset():
+        raise SystemExit("machine.reset")
+
+
+class _MicroPython:
+    """The micropython module on CPython, for lib/logging.py."""
+
+    def const(value):
+        return value
+
+
+class _UStruct:
+    """ustruct on CPython, MicroPython unpacks the head of longer buffers."""
+
+    def __init__(self):
+        import struct
+
+        self.pack = struct.pack
+        self.pack_into = struct.pack_into
+        self.unpack_from = struct.unpack_from
+        self.calcsize = struct.calcsize
+        self.unpack = struct.unpack_from
+
+
+def lcg(seed):
+    """Deterministic byte stream, the same on CPython and MicroPython."""
+    state = seed
+    while True:
+        state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+        yield state >> 16 & 0xFF
+
+
+def pms7003_frame(stream):
+    """A valid PMS7003 frame with data bytes from stream."""
+    data = bytearray(32)
+    data[0] = 0x42
+    data[1] = 0x4D
+    data[3] = 28
+    for index in range(4, 28):
+        data[index] = next(stream)
+    data[28] = 0x97
+    checksum = sum(data[:30])
+    data[30] = checksum >> 8
+    data[31] = checksum & 0xFF
+    return data
+
+
+def pms7003_recording(frames, seed=1):
+    """PMS7003 traffic: frames valid frames, each after up to 15 noise
+    bytes, every tenth one preceded by a frame with a broken checksum.
+
+    The noise holds no 0x42, the original reader of tests/uart_reference.py
+    consumes the byte after a lone 0x42 and would miss a header right
+    behind it.
+    """
+    stream = lcg(seed)
+    data = bytearray()
+    for index in range(frames):
+        for _ in range(next(stream) % 16):
+            data.append(next(stream) & 0x3F)
+        if index % 10 == 9:
+            broken = pms7003_frame(stream)
+            broken[31] ^= 0xFF
+            data.extend(broken)
+        data.extend(pms7003_frame(stream))
+    return data
+
+
+def install():
+    if SOURCE not in sys.path:
+        sys.path.insert(0, SOURCE)
+    sys.modules["machine"] = FakeMachine
+    try:
+        from micropython import const  # noqa: F401
+    except ImportError:
+        # also shadows the micropython/ directory, a namespace package on CPython
+        sys.modules["micropython"] = _MicroPython
+    if not hasattr(time, "ticks_ms"):
+        time.ticks_ms = lambda: int(time.monotonic() * 1000)
+        time.ticks_us = lambda: int(time.monotonic() * 1000000)
+        time.ticks_add = lambda ticks, delta: ticks + delta
+        time.ticks_diff = lambda end, start: end - start
+        time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+        time.sleep_us = lambda us: time.sleep(us / 1000000)
+        sys.modules["utime"] = time
+        sys.modules["ustruct"] = _UStruct()
+
+
+def allocated_by(function):
+    """Returns the bytes function() allocates on the heap, None off
+    MicroPython. The collector is paused so nothing is freed meanwhile."""
+    import gc
+
+    if not hasattr(gc, "mem_alloc"):
+        return None
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.mem_alloc()
+        function()
+        return gc.mem_alloc() - before
+    finally:
+        gc.enable()
+
+
+def skip(reason):
+    """Skips the running test under pytest, otherwise returns False so the
+    test can return early."""
+    pytest = sys.modules.get("pytest")
+    if pytest is None:
+        print("skipped:", reason)
+        return False
+    pytest.skip(reason)
+
+
+def run(namespace):
+    """Runs the test_ functions of a module, for the MicroPython unix port."""
+    failed = 0
+    for name in sorted(namespace):
+        if name.startswith("test_"):
+            try:
+                namespace[name]()
+                print("ok", name)
+            except Exception as error:
+                failed += 1
+                print("FAIL", name, repr(error))
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,160 @@
+import fakes
+
+fakes.install()
+
+import bme680  # noqa: E402
+import bme680_reference as reference  # noqa: E402
+from bme680_constants import (  # noqa: E402
+    ADDR_RANGE_SW_ERR_ADDR,
+    ADDR_RES_HEAT_RANGE_ADDR,
+    ADDR_RES_HEAT_VAL_ADDR,
+    CHIP_ID,
+    CHIP_ID_ADDR,
+    COEFF_ADDR1,
+    COEFF_ADDR1_LEN,
+    COEFF_ADDR2,
+    COEFF_ADDR2_LEN,
+    CONF_SHADOW_ADDR,
+    CONF_SHADOW_LEN,
+    CONF_T_P_MODE_ADDR,
+    ENABLE_GAS_MEAS,
+    FIELD0_ADDR,
+    FILTER_SIZE_3,
+    FILTER_SIZE_7,
+    FORCED_MODE,
+    I2C_ADDR_PRIMARY,
+    NEW_DATA_MSK,
+    OS_16X,
+    OS_2X,
+    OS_4X,
+    OS_8X,
+)
+from i2c import I2CAdapter  # noqa: E402
+
+CALIBRATION_SEEDS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+# (temperature, pressure, humidity) ADC values across the measuring range, -40 to 85 °C,
+# 300 to 1100 hPa and 0 to 100 %RH, plus both ends of the ADC ranges
+TPH_ADC = (
+    (0, 0, 0),
+    (350000, 250000, 12000),
+    (415000, 300000, 18000),
+    (468000, 330000, 21000),
+    (498000, 360000, 24500),
+    (512000, 395000, 27000),
+    (530000, 420000, 30000),
+    (560000, 480000, 36000),
+    (620000, 520000, 42000),
+    (1048575, 1048575, 65535),
+)
+GAS_ADC = (0, 1, 100, 256, 512, 700, 1000, 1023)
+
+
+def make_sensor(seed=1, writes=None):
+    """A BME680 on a loopback bus, with calibration registers from seed.
+
+    Every write transaction is appended to writes as (register, data).
+    """
+    adapter = I2CAdapter(scl=22, sda=21)
+    registers = adapter.bus.device(I2C_ADDR_PRIMARY)
+
+    def writeto_mem(addr, memaddr, buf, addrsize=8):
+        # the BME680 takes the first value at memaddr, then register/value pairs
+        if writes is not None:
+            writes.append((memaddr, bytes(buf)))
+        registers[memaddr] = buf[0]
+        for index in range(1, len(buf) - 1, 2):
+            registers[buf[index]] = buf[index + 1]
+
+    adapter.writeto_mem = writeto_mem
+    stream = fakes.lcg(seed)
+    for register in range(COEFF_ADDR1, COEFF_ADDR1 + COEFF_ADDR1_LEN):
+        registers[register] = next(stream)
+    for register in range(COEFF_ADDR2, COEFF_ADDR2 + COEFF_ADDR2_LEN):
+        registers[register] = next(stream)
+    for register in (
+        ADDR_RES_HEAT_VAL_ADDR,
+        ADDR_RES_HEAT_RANGE_ADDR,
+        ADDR_RANGE_SW_ERR_ADDR,
+    ):
+        registers[register] = next(stream)
+    registers[CHIP_ID_ADDR] = CHIP_ID
+    # a measurement is always ready, the constructor reads one
+    registers[FIELD0_ADDR] = NEW_DATA_MSK
+    return bme680.BME680(i2c_addr=I2C_ADDR_PRIMARY, i2c_device=adapter), adapter.bus
+
+
+def test_unchanged_settings_are_not_written():
+    writes = []
+    sensor, bus = make_sensor(writes=writes)
+    bus.log = []
+    del writes[:]
+    # what main.py sets after the constructor, which already did
+    sensor.set_humidity_oversample(OS_2X)
+    sensor.set_pressure_oversample(OS_4X)
+    sensor.set_temperature_oversample(OS_8X)
+    sensor.set_filter(FILTER_SIZE_3)
+    sensor.set_gas_status(ENABLE_GAS_MEAS)
+    assert bus.log == []
+    assert writes == []
+
+
+def test_changed_settings_are_written_in_one_burst():
+    writes = []
+    sensor, bus = make_sensor(writes=writes)
+    bus.log = []
+    del writes[:]
+    sensor.set_humidity_oversample(OS_16X)
+    sensor.set_temperature_oversample(OS_2X)
+    sensor.set_filter(FILTER_SIZE_7)
+    sensor.set_power_mode(FORCED_MODE, blocking=False)
+
+    # one write, no read back, where every setter used to read and write its register
+    assert bus.log == []
+    assert len(writes) == 1
+    first, data = writes[0]
+    burst = [first] + list(data[1::2])
+    assert sorted(burst) == [0x72, 0x74, 0x75]
+    assert burst[-1] == CONF_T_P_MODE_ADDR
+
+    registers = bus.device(I2C_ADDR_PRIMARY)
+    assert (
+        registers[CONF_SHADOW_ADDR : CONF_SHADOW_ADDR + CONF_SHADOW_LEN]
+        == sensor._config
+    )
+    assert sensor.get_humidity_oversample() == OS_16X
+    assert sensor.get_temperature_oversample() == OS_2X
+    assert sensor.get_filter() == FILTER_SIZE_7
+    assert registers[CONF_T_P_MODE_ADDR] & 0x03 == FORCED_MODE
+
+
+def outcome(function, *args):
+    try:
+        return function(*args)
+    except ZeroDivisionError:
+        return ZeroDivisionError
+
+
+def test_compensation_matches_reference():
+    for seed in CALIBRATION_SEEDS:
+        sensor, _ = make_sensor(seed)
+        c = sensor.calibration_data
+        for temperature_adc, pressure_adc, humidity_adc in TPH_ADC:
+            expected_temperature, t_fine = reference.temperature(c, temperature_adc)
+            assert sensor._calc_temperature(temperature_adc) == expected_temperature
+            assert c.t_fine == t_fine
+            assert outcome(sensor._calc_pressure, pressure_adc) == outcome(
+                reference.pressure, c, t_fine, pressure_adc
+            )
+            assert sensor._calc_humidity(humidity_adc) == reference.humidity(
+                c, t_fine, humidity_adc
+            )
+        for gas_range in range(16):
+            for gas_adc in GAS_ADC:
+                assert outcome(
+                    sensor._calc_gas_resistance, gas_adc, gas_range
+                ) == outcome(reference.gas_resistance, c, gas_adc, gas_range)
+
+
+if __name__ == "__main__":
+    fakes.run(globals())
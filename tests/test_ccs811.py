@@ -0,0 +1,104 @@
+import os
+import time
+
+import fakes
+
+fakes.install()
+
+import ccs811  # noqa: E402
+from ccs811 import CCS811  # noqa: E402
+from i2c import I2CAdapter  # noqa: E402
+
+ADDR = 0x5A
+MEAS_MODE = 0x01
+BASELINE = 0x11
+BASELINE_PATH = "test_ccs811_baseline"
+
+
+def make_bus(meas_mode=0x00):
+    """A CCS811 in application mode on a loopback bus."""
+    adapter = I2CAdapter(scl=22, sda=21)
+    registers = adapter.bus.device(ADDR)
+    registers[0x20] = 0x81  # HW_ID
+    registers[0x00] = 0x10  # STATUS, application valid
+    registers[MEAS_MODE] = meas_mode
+    return adapter, registers
+
+
+def test_drive_mode_is_set_after_power_up():
+    adapter, registers = make_bus()
+    sensor = CCS811(i2c=adapter, addr=ADDR, mode=2)
+    assert registers[MEAS_MODE] == 0x28
+    assert sensor.poll() is False  # no result yet, read over I2C
+
+
+def test_running_drive_mode_is_kept():
+    adapter, registers = make_bus(meas_mode=0x28)
+    adapter.bus.log = []
+    CCS811(i2c=adapter, addr=ADDR, mode=2)
+    assert [entry for entry in adapter.bus.log if entry[0] == "w"] == []
+
+
+def test_slower_drive_mode_waits_in_idle():
+    adapter, registers = make_bus(meas_mode=0x18)
+    sensor = CCS811(i2c=adapter, addr=ADDR, mode=2)
+    assert registers[MEAS_MODE] == 0x08
+    assert sensor.poll() is False
+    assert registers[MEAS_MODE] == 0x08
+
+    idle_ms = ccs811.MODE_SWITCH_IDLE_MS
+    ccs811.MODE_SWITCH_IDLE_MS = 0
+    try:
+        sensor.poll()
+    finally:
+        ccs811.MODE_SWITCH_IDLE_MS = idle_ms
+    assert registers[MEAS_MODE] == 0x28
+
+
+def test_raw_data_mode_is_rejected():
+    adapter, _ = make_bus()
+    try:
+        CCS811(i2c=adapter, addr=ADDR, mode=4)
+    except ValueError:
+        return
+    raise AssertionError("mode 4 accepted")
+
+
+def restored(saved_line):
+    adapter, registers = make_bus()
+    sensor = CCS811(i2c=adapter, addr=ADDR, mode=2)
+    try:
+        with open(BASELINE_PATH, "w") as baseline_file:
+            baseline_file.write(saved_line)
+        result = sensor.restore_baseline(BASELINE_PATH)
+    finally:
+        os.remove(BASELINE_PATH)
+    return result, registers[BASELINE] << 8 | registers[BASELINE + 1]
+
+
+def test_baseline_round_trip():
+    adapter, registers = make_bus()
+    registers[BASELINE] = 0x12
+    registers[BASELINE + 1] = 0x34
+    sensor = CCS811(i2c=adapter, addr=ADDR, mode=2)
+    try:
+        sensor.save_baseline(BASELINE_PATH)
+        with open(BASELINE_PATH) as baseline_file:
+            saved_line = baseline_file.readline()
+    finally:
+        os.remove(BASELINE_PATH)
+    assert restored(saved_line) == (True, 0x1234)
+
+
+def test_stale_baseline_is_not_restored():
+    now = int(time.time())
+    assert restored("18 52 %d\n" % (now - 3600)) == (True, 0x1234)
+    assert restored("18 52 %d\n" % (now - ccs811.BASELINE_MAX_AGE_S - 60)) == (False, 0)
+    # saved before the clock restarted with a power loss
+    assert restored("18 52 %d\n" % (now + 3600)) == (False, 0)
+    # saved without a time by an older release
+    assert restored("18 52\n") == (False, 0)
+
+
+if __name__ == "__main__":
+    fakes.run(globals())
@@ -0,0 +1,80 @@
+import fakes
+
+fakes.install()
+
+import dfrobot_mics  # noqa: E402
+from dfrobot_mics import MICS_READY, MICS_UNCALIBRATED, Mics  # noqa: E402
+from i2c import I2CAdapter  # noqa: E402
+
+ADDR = 0x75
+OX_REGISTER = 0x04
+
+
+def make_sensor(ox, red, power):
+    """A MiCS-4514 on a loopback bus, reading the given raw values."""
+    adapter = I2CAdapter(scl=22, sda=21)
+    registers = adapter.bus.device(ADDR)
+    for index, value in enumerate((ox, red, power)):
+        registers[OX_REGISTER + 2 * index] = value >> 8
+        registers[OX_REGISTER + 2 * index + 1] = value & 0xFF
+    sensor = Mics(adapter)
+    # keep the baseline off the disk
+    sensor.save_baseline = lambda: None
+    return sensor
+
+
+def test_get_mics_data_subtracts_from_power():
+    sensor = make_sensor(ox=0x0123, red=0x0345, power=0x0400)
+    assert sensor.get_mics_data() == [0x0400 - 0x0123, 0x0400 - 0x0345, 0x0400]
+    # readings above the power reference are clamped
+    sensor = make_sensor(ox=0x0500, red=0x0500, power=0x0400)
+    assert sensor.get_mics_data() == [0, 0, 0x0400]
+
+
+def test_uncalibrated_sensor_reports_nothing():
+    sensor = make_sensor(ox=100, red=200, power=1000)
+    assert sensor.state == MICS_UNCALIBRATED
+    assert not sensor.tick()
+    assert sensor.get_all_gas_ppm() is None
+    assert sensor.get_all_gas_exist() is None
+
+
+def test_warm_up_calibrates():
+    warm_up_ms = dfrobot_mics._MICS_WARM_UP_MS
+    interval_ms = dfrobot_mics._MICS_CALIBRATION_INTERVAL_MS
+    dfrobot_mics._MICS_WARM_UP_MS = 0
+    dfrobot_mics._MICS_CALIBRATION_INTERVAL_MS = 0
+    try:
+        sensor = make_sensor(ox=100, red=200, power=1000)
+        sensor.start_warm_up()
+        # the tick ending the warm-up takes the first sample
+        for _ in range(dfrobot_mics._MICS_CALIBRATION_SAMPLES - 1):
+            assert not sensor.tick()
+        assert sensor.tick()
+    finally:
+        dfrobot_mics._MICS_WARM_UP_MS = warm_up_ms
+        dfrobot_mics._MICS_CALIBRATION_INTERVAL_MS = interval_ms
+    assert sensor.state == MICS_READY
+    # R0 is the mean reading, the same readings give ratios of 1
+    assert sensor._get_ratios() == (1.0, 1.0)
+    assert sorted(sensor.get_all_gas_ppm()) == sorted(dfrobot_mics._MICS_PPM_GASES)
+
+
+def test_get_mics_data_does_not_allocate():
+    sensor = make_sensor(ox=100, red=200, power=1000)
+
+    def read():
+        for _ in range(100):
+            sensor.get_mics_data()
+
+    read()
+    allocated = fakes.allocated_by(read)
+    if allocated is None:
+        return fakes.skip(
+            "gc.mem_alloc needs MicroPython, run micropython tests/test_dfrobot_mics.py"
+        )
+    assert allocated == 0
+
+
+if __name__ == "__main__":
+    fakes.run(globals())
@@ -0,0 +1,55 @@
+import fakes
+
+fakes.install()
+
+from i2c import I2CAdapter, I2CArbiter  # noqa: E402
+
+ADDR = 0x77
+ROUNDS = 100
+
+
+def make_adapter():
+    adapter = I2CAdapter(scl=22, sda=21)
+    registers = adapter.bus.device(ADDR)
+    for register in range(256):
+        registers[register] = register
+    return adapter
+
+
+def test_smbus_helpers():
+    adapter = make_adapter()
+    assert adapter.read_byte_data(ADDR, 0x1D) == 0x1D
+    adapter.write_byte_data(ADDR, 0x74, 0x25)
+    assert adapter.read_byte_data(ADDR, 0x74) == 0x25
+    buf = bytearray(3)
+    adapter.read_into(ADDR, 0x10, buf)
+    assert buf == bytearray((0x10, 0x11, 0x12))
+    assert adapter.read_i2c_block_data(ADDR, 0x10, 2) == b"\x10\x11"
+
+
+def allocated(bus):
+    buf = bytearray(15)
+
+    def single_register_access():
+        for _ in range(ROUNDS):
+            bus.write_byte_data(ADDR, 0x74, 0x25)
+            bus.read_byte_data(ADDR, 0x74)
+            bus.read_into(ADDR, 0x1D, buf)
+
+    # the arbiter creates the usage entry of a device on its first transaction
+    single_register_access()
+    return fakes.allocated_by(single_register_access)
+
+
+def test_single_register_access_does_not_allocate():
+    adapter = make_adapter()
+    if allocated(adapter) is None:
+        return fakes.skip(
+            "gc.mem_alloc needs MicroPython, run micropython tests/test_i2c.py"
+        )
+    assert allocated(adapter) == 0
+    assert allocated(I2CArbiter(adapter)) == 0
+
+
+if __name__ == "__main__":
+    fakes.run(globals())
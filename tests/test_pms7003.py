@@ -0,0 +1,55 @@
+from array import array
+
+import fakes
+
+fakes.install()
+
+import uart_reference as reference  # noqa: E402
+from pms7003 import Pms7003  # noqa: E402
+
+FRAMES = 50
+
+
+def make_sensor(data):
+    sensor = Pms7003(uart=2)
+    sensor.uart.feed(data)
+    return sensor
+
+
+def test_read_into_skips_noise_and_corrupted_frames():
+    data = fakes.pms7003_recording(FRAMES)
+    uart = fakes.FakeUART()
+    uart.feed(data)
+    sensor = make_sensor(data)
+    values = array("H", [0] * Pms7003.PMS_VALUES)
+    for _ in range(FRAMES):
+        expected = reference.pms7003_read(uart)
+        sensor.read_into(values)
+        assert values[Pms7003.PMS_PM1_0_ATM] == expected["PM1_0_ATM"]
+        assert values[Pms7003.PMS_PM2_5_ATM] == expected["PM2_5_ATM"]
+        assert values[Pms7003.PMS_PM10_0_ATM] == expected["PM10_0_ATM"]
+        assert values[Pms7003.PMS_CHECKSUM] == expected["CHECKSUM"]
+    assert sensor.frame_sync.frames == FRAMES
+    assert sensor.frame_sync.checksum_errors == FRAMES // 10
+
+
+def test_read_into_does_not_allocate():
+    sensor = make_sensor(fakes.pms7003_recording(FRAMES))
+    values = array("H", [0] * Pms7003.PMS_VALUES)
+
+    def read_into():
+        for _ in range(FRAMES - 1):
+            sensor.read_into(values)
+
+    # the first frame goes through every code path once
+    sensor.read_into(values)
+    allocated = fakes.allocated_by(read_into)
+    if allocated is None:
+        return fakes.skip(
+            "gc.mem_alloc needs MicroPython, run micropython tests/test_pms7003.py"
+        )
+    assert allocated == 0
+
+
+if __name__ == "__main__":
+    fakes.run(globals())
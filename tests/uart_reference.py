@@ -0,0 +1,162 @@
+"""
+The UART sensor decoders as they were before the frame buffer rewrite,
+kept verbatim as the baseline of the benchmarks. Every function reads
+from a machine.UART like object.
+"""
+
+import struct
+
+PMS_START_BYTE_1 = 0x42
+PMS_START_BYTE_2 = 0x4D
+PMS_CHECKSUM = 15
+
+
+def _assert_byte(byte, expected):
+    if byte is None or len(byte) < 1 or ord(byte) != expected:
+        return False
+    return True
+
+
+def pms7003_read(uart):
+    """Pms7003.read, two single byte reads per sync attempt and a dict per frame."""
+    while True:
+        first_byte = uart.read(1)
+        if not _assert_byte(first_byte, PMS_START_BYTE_1):
+            continue
+
+        second_byte = uart.read(1)
+        if not _assert_byte(second_byte, PMS_START_BYTE_2):
+            continue
+
+        # we are reading 30 bytes left
+        read_bytes = uart.read(30)
+        if len(read_bytes) < 30:
+            continue
+
+        data = struct.unpack("!HHHHHHHHHHHHHBBH", read_bytes)
+
+        checksum = PMS_START_BYTE_1 + PMS_START_BYTE_2
+        checksum += sum(read_bytes[:28])
+
+        if checksum != data[PMS_CHECKSUM]:
+            continue
+
+        return {
+            "FRAME_LENGTH": data[0],
+            "PM1_0": data[1],
+            "PM2_5": data[2],
+            "PM10_0": data[3],
+            "PM1_0_ATM": data[4],
+            "PM2_5_ATM": data[5],
+            "PM10_0_ATM": data[6],
+            "PCNT_0_3": data[7],
+            "PCNT_0_5": data[8],
+            "PCNT_1_0": data[9],
+            "PCNT_2_5": data[10],
+            "PCNT_5_0": data[11],
+            "PCNT_10_0": data[12],
+            "VERSION": data[13],
+            "ERROR": data[14],
+            "CHECKSUM": data[15],
+        }
+
+
+def sds011_make_command(cmd, mode, param):
+    """SDS011.make_command, rebuilt for every command."""
+    header = b"\xaa\xb4"
+    padding = b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xff"
+    checksum = chr((ord(cmd) + ord(mode) + ord(param) + 255 + 255) % 256)
+    checksum = bytes(checksum, "utf8")
+    tail = b"\xab"
+
+    return header + cmd + mode + param + padding + checksum + tail
+
+
+def sds011_process_measurement(packet):
+    """SDS011.process_measurement, returns (pm25, pm10, packet_status)."""
+    *data, checksum, tail = struct.unpack("<HHBBBs", packet)
+    pm25 = data[0] / 10.0
+    pm10 = data[1] / 10.0
+    checksum_ok = checksum == (sum(data) % 256)
+    tail_ok = tail == b"\xab"
+    return pm25, pm10, checksum_ok and tail_ok
+
+
+def sds011_read(uart):
+    """SDS011.read, a query then up to 512 single byte reads. Returns what
+    process_measurement set, None if no measurement was found.
+
+    The query is built from bytes, the original passed chr(0) which only
+    worked as long as bytes and str could be concatenated.
+    """
+    uart.write(sds011_make_command(b"\x04", b"\x00", b"\x00"))
+
+    for _ in range(512):
+        header = uart.read(1)
+        if header == b"\xaa":
+            command = uart.read(1)
+
+            if command == b"\xc0":
+                packet = uart.read(8)
+                if packet is not None:
+                    return sds011_process_measurement(packet)
+    return None
+
+
+def _make_16bit_int(high, low) -> int:
+    """Utility.make_16bit_int, combine two 8-bit integers into a 16-bit integer."""
+    return int(high) << 8 | int(low)
+
+
+def ptqs1005_parse(raw_resp: bytes) -> dict:
+    """ResponseParser.parse, every field through make_16bit_int."""
+    magic_header = bytes([0x42, 0x4D, 0x00, 0x26])
+    calculated_checksum = sum(raw_resp[:40]) & 0xFFFF
+    received_checksum = _make_16bit_int(raw_resp[40], raw_resp[41])
+    if raw_resp[:4] != magic_header or calculated_checksum != received_checksum:
+        raise Exception("Invalid response")
+
+    parsed_data = {}
+    parsed_data["pm10"] = _make_16bit_int(raw_resp[4], raw_resp[5])  # PM1
+    parsed_data["pm25"] = _make_16bit_int(raw_resp[6], raw_resp[7])  # PM2.5
+    parsed_data["pm100"] = _make_16bit_int(raw_resp[8], raw_resp[9])  # PM10
+    parsed_data["pm10_atm"] = _make_16bit_int(
+        raw_resp[10], raw_resp[11]
+    )  # "PM1 (atmosphere)"
+    parsed_data["pm25_atm"] = _make_16bit_int(
+        raw_resp[12], raw_resp[13]
+    )  # "PM2.5 (atmosphere)"
+    parsed_data["pm100_atm"] = _make_16bit_int(
+        raw_resp[14], raw_resp[15]
+    )  # "PM10 (atmosphere)"
+    parsed_data["part03"] = _make_16bit_int(
+        raw_resp[16], raw_resp[17]
+    )  # "0.3um particles"
+    parsed_data["part05"] = _make_16bit_int(
+        raw_resp[18], raw_resp[19]
+    )  # "0.5um particles"
+    parsed_data["part10"] = _make_16bit_int(
+        raw_resp[20], raw_resp[21]
+    )  # "1.0um particles"
+    parsed_data["part25"] = _make_16bit_int(
+        raw_resp[22], raw_resp[23]
+    )  # "2.5um particles"
+    parsed_data["part50"] = _make_16bit_int(
+        raw_resp[24], raw_resp[25]
+    )  # "5.0um particles"
+    parsed_data["part100"] = _make_16bit_int(
+        raw_resp[26], raw_resp[27]
+    )  # "10.0um particles"
+    parsed_data["tvoc"] = _make_16bit_int(raw_resp[28], raw_resp[29]) / 100.0  # "TVOC"
+    parsed_data["tvoc_quan"] = int(raw_resp[30])  # "TVOC quantity"
+    parsed_data["hcho"] = _make_16bit_int(raw_resp[31], raw_resp[32]) / 100.0  # "HCHO"
+    parsed_data["hcho_quan"] = int(raw_resp[33])  # "HCHO quantity"
+    parsed_data["co2"] = _make_16bit_int(raw_resp[34], raw_resp[35])  # "CO2"
+    parsed_data["temp"] = (
+        _make_16bit_int(raw_resp[36], raw_resp[37]) / 10.0
+    )  # "Temperature"
+    parsed_data["hum"] = (
+        _make_16bit_int(raw_resp[38], raw_resp[39]) / 10.0
+    )  # "Humidity"
+
+    return parsed_data